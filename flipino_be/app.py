@@ -1,82 +1,176 @@
+import atexit
+import contextlib
 import json
+import multiprocessing
 import os
-from flask import Flask, request, jsonify
+import sys
+import threading
+import time
+import uuid
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-import psycopg2
 import bcrypt
-from supabase import create_client, Client
 from dotenv import load_dotenv
-import cv2
-import mediapipe as mp
-import numpy as np
-from fastdtw import fastdtw
-from scipy.spatial.distance import euclidean
+from upload_store import UploadStore
+from db import ConnectionPool
+from history_writer import HistoryWriter, write_history
+from history import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, fetch_history
+from progress import fetch_progress
+from ttl_cache import UserTTLCache
+from jobs import enqueue_job, get_job, is_job_id
+import metrics
+from metrics import span
+import batch_scoring
+try:
+    from flask_sock import Sock  # optional: only /live needs it
+except ImportError:
+    Sock = None
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
+sock = Sock(app) if Sock is not None else None
+
+# Which endpoints this process serves:
+#   'all'     - everything; the CV/scoring stack loads on the first upload (or warms in the background)
+#   'api'     - only the light endpoints (auth, history, feedback, job status); never loads OpenCV or MediaPipe
+#   'scoring' - everything, with the scoring stack loaded and warmed before the first request
+# Split deployments route /upload, /batch_upload, /score_landmarks, /recognize, /live and /pose_pool_stats
+# to a 'scoring' service.
+SERVICE_ROLE = os.getenv('SERVICE_ROLE', 'all')
+SCORING_ENDPOINTS = {'upload_video', 'batch_upload', 'score_landmarks', 'recognize_figure', 'live_scoring',
+                     'get_pose_pool_stats'}
+
+# /batch_upload's scoring processes re-import this module when it is run as a script; they don't serve requests
+IN_BATCH_PROCESS = multiprocessing.parent_process() is not None
+
+def scoring():
+    """The CV and scoring runtime (scoring_service), imported on first use."""
+    import scoring_service
+    return scoring_service
 
 # Supabase Configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+_supabase = None
+
+def get_supabase():
+    """The Supabase client, created on first use (only /signup and /login need it)."""
+    global _supabase
+    if _supabase is None:
+        from supabase import create_client
+        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
 
 # PostgreSQL Database Connection
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-def get_db_connection():
-    return psycopg2.connect(DATABASE_URL)
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))  # seconds to wait for a free connection
+db_pool = ConnectionPool(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT)
+if os.getenv('DB_POOL_WARMUP', '1') == '1' and not IN_BATCH_PROCESS:
+    try:
+        db_pool.warm_up()
+    except Exception as e:
+        print(f"❌ Database pool warm-up failed: {e}")
+atexit.register(db_pool.close)
+
+@contextlib.contextmanager
+def db_connection():
+    """Borrow a pooled connection: `with db_connection() as conn:` (timed as the 'postgres' stage)."""
+    with span('postgres'), db_pool.connection() as conn:
+        yield conn
+
+# Attempts and play counts are buffered and written in batches off the request path
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', '1.0'))  # seconds
+HISTORY_BUFFER_MAX = int(os.getenv('HISTORY_BUFFER_MAX', '1000'))
+
+# /user_history and /progress responses are cached briefly per user and dropped once that user's
+# new attempts are written
+HISTORY_CACHE_TTL = float(os.getenv('HISTORY_CACHE_TTL', '10'))  # seconds; 0 disables
+history_cache = UserTTLCache(HISTORY_CACHE_TTL)
+progress_cache = UserTTLCache(HISTORY_CACHE_TTL)
+
+def invalidate_history_cache(rows):
+    for user_id in {row[0] for row in rows}:
+        history_cache.invalidate(user_id)
+        progress_cache.invalidate(user_id)
+
+history_writer = HistoryWriter(db_connection, HISTORY_FLUSH_INTERVAL, HISTORY_BUFFER_MAX,
+                               on_flush=invalidate_history_cache)
+atexit.register(history_writer.close)
+atexit.register(batch_scoring.shutdown)
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-DANCE_POSES_FILE = os.path.join(os.path.dirname(__file__), 'dance_poses', ''
-'.json')
-
-LANDMARK_IDS = [0, 11, 12, 13, 14, 15, 16, 23, 24, 25, 26, 27, 28]  # Match xyz.py
-LANDMARK_NAMES = {
-    0: "Head",
-    11: "Left Shoulder",
-    12: "Right Shoulder",
-    13: "Left Elbow",
-    14: "Right Elbow",
-    15: "Left Wrist",
-    16: "Right Wrist",
-    23: "Left Hip",
-    24: "Right Hip",
-    25: "Left Knee",
-    26: "Right Knee",
-    27: "Left Ankle",
-    28: "Right Ankle"
-}
-
-def load_dance_poses():
-    try:
-        with open(DANCE_POSES_FILE, 'r') as file:
-            dance_data = json.load(file)
+# Uploads are stored by content hash next to their cached results, within a disk budget
+UPLOAD_DISK_BUDGET_MB = int(os.getenv('UPLOAD_DISK_BUDGET_MB', '500'))
+upload_store = UploadStore(os.path.join(UPLOAD_FOLDER, 'store'), UPLOAD_DISK_BUDGET_MB * 1024 * 1024)
 
-        print(f"✅ Loaded {len(dance_data)} dance poses")
+# 'sync' scores /upload in the request; 'async' queues a job for worker.py (clients may send mode=async)
+UPLOAD_MODE = os.getenv('UPLOAD_MODE', 'sync')
+MAX_QUEUE_DEPTH = int(os.getenv('MAX_QUEUE_DEPTH', '100'))
+JOB_RETRY_AFTER = int(os.getenv('JOB_RETRY_AFTER', '30'))  # seconds, sent with 429s
 
-        for pose in dance_data:
-            if isinstance(pose, dict) and "landmarks" in pose:
-                for landmark in pose["landmarks"]:
-                    landmark["z"] = landmark.get("z", 0.0) or 0.0
-            else:
-                print(f"⚠️ Invalid pose format: {pose}")
-
-        return dance_data
-    except Exception as e:
-        print(f"❌ Error loading dance poses: {e}")
-        return []
+# Pose estimators are warmed before the first request in the scoring role and
+# in a background thread in the 'all' role, so light endpoints come up immediately
+if SERVICE_ROLE != 'api' and os.getenv('POSE_POOL_WARMUP', '1') == '1' and not IN_BATCH_PROCESS:
+    if SERVICE_ROLE == 'scoring':
+        scoring().warm_up()
+    else:
+        threading.Thread(target=lambda: scoring().warm_up(), name='scoring-warmup', daemon=True).start()
+
+# Requests slower than this print their stage breakdown; 0 turns the log off
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', '0'))
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.trace_token = metrics.start_trace()
+
+@app.before_request
+def check_service_role():
+    if SERVICE_ROLE == 'api' and request.endpoint in SCORING_ENDPOINTS:
+        return jsonify({'error': 'Scoring is not served by this process'}), 404
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    token = g.pop('trace_token', None)
+    if started is None or token is None:
+        return response
+    seconds = time.perf_counter() - started
+    trace = metrics.finish_trace(token)
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe('flipino_request_seconds', seconds, route=route, method=request.method, status=response.status_code)
+    if response.status_code >= 500:
+        metrics.inc('flipino_errors_total', route=route)
+    if SLOW_REQUEST_SECONDS and seconds > SLOW_REQUEST_SECONDS:
+        print(f"🐢 Slow request {request.method} {route} {response.status_code} took {seconds:.3f}s: "
+              f"{metrics.format_breakdown(trace) or 'no stages recorded'}")
+    return response
+
+def runtime_gauges():
+    pool = db_pool.stats()
+    writer = history_writer.stats()
+    gauges = {
+        'flipino_db_pool_in_use': pool['in_use'],
+        'flipino_db_pool_waiting': pool['waiting'],
+        'flipino_db_pool_created': pool['created'],
+        'flipino_history_pending': writer['pending'],
+    }
+    # Only once something has loaded the scoring stack; a scrape must not pull in OpenCV
+    if 'scoring_service' in sys.modules:
+        poses = scoring().pose_pool.stats()
+        gauges.update(flipino_pose_pool_in_use=poses['in_use'], flipino_pose_pool_waiting=poses['waiting'])
+    return gauges
 
-dance_poses = load_dance_poses()
-dance_poses = [
-    pose for pose in dance_poses
-    if isinstance(pose, dict) and "landmarks" in pose and pose["landmarks"]
-]
+metrics.register_gauges(runtime_gauges)
 
 @app.route('/signup', methods=['POST'])
 def signup():
@@ -91,35 +185,33 @@ def signup():
 
         # Check if username or email already exists in your users table
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-            if cursor.fetchone():
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+                username_taken = cursor.fetchone()
+                cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+                email_taken = cursor.fetchone()
                 cursor.close()
-                conn.close()
+            if username_taken:
                 return jsonify({"error": "Username already exists"}), 400
-            cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-            if cursor.fetchone():
-                cursor.close()
-                conn.close()
+            if email_taken:
                 return jsonify({"error": "Email already exists"}), 400
-            cursor.close()
-            conn.close()
         except Exception as db_error:
             print(f"❌ DB Check Error: {db_error}")
             return jsonify({"error": "Database error"}), 500
 
         # Supabase Auth signup with display_name
-        auth_response = supabase.auth.sign_up({
-            "email": email,
-            "password": password,
-            "options": {
-                "data": {
-                    "username": username,
-                    "display_name": username
+        with span('supabase'):
+            auth_response = get_supabase().auth.sign_up({
+                "email": email,
+                "password": password,
+                "options": {
+                    "data": {
+                        "username": username,
+                        "display_name": username
+                    }
                 }
-            }
-        })
+            })
 
         if getattr(auth_response, "error", None):
             return jsonify({"error": auth_response.error.message}), 400
@@ -127,26 +219,25 @@ def signup():
         # Insert into your own users table
         user_id = auth_response.user.id
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            # Check if user already exists
-            cursor.execute("SELECT id FROM users WHERE id = %s", (user_id,))
-            exists = cursor.fetchone()
-            if exists:
-                # Update username if user exists
-                cursor.execute(
-                    "UPDATE users SET username = %s WHERE id = %s",
-                    (username, user_id)
-                )
-            else:
-                # Insert new user
-                cursor.execute(
-                    "INSERT INTO users (id, username, email, profile_picture_url) VALUES (%s, %s, %s, %s)",
-                    (user_id, username, email, "default_profile_picture_url")
-                )
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                # Check if user already exists
+                cursor.execute("SELECT id FROM users WHERE id = %s", (user_id,))
+                exists = cursor.fetchone()
+                if exists:
+                    # Update username if user exists
+                    cursor.execute(
+                        "UPDATE users SET username = %s WHERE id = %s",
+                        (username, user_id)
+                    )
+                else:
+                    # Insert new user
+                    cursor.execute(
+                        "INSERT INTO users (id, username, email, profile_picture_url) VALUES (%s, %s, %s, %s)",
+                        (user_id, username, email, "default_profile_picture_url")
+                    )
+                conn.commit()
+                cursor.close()
         except Exception as db_error:
             print(f"❌ DB Insert Error: {db_error}")
             # Optionally, return a warning but not an error to the client
@@ -168,7 +259,8 @@ def login():
             return jsonify({"error": "Both email and password are required"}), 400
 
         # Use Supabase Auth to sign in
-        auth_response = supabase.auth.sign_in_with_password({"email": email, "password": password})
+        with span('supabase'):
+            auth_response = get_supabase().auth.sign_in_with_password({"email": email, "password": password})
 
         if getattr(auth_response, "error", None):
             return jsonify({"error": "Email or password is incorrect"}), 400
@@ -183,6 +275,97 @@ def login():
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 
+def dance_name_for(figure):
+    """Determine dance_name from figure filename"""
+    figure = (figure or '').lower()
+    if figure.startswith('tiklostut'):
+        return 'Tiklos: Step-by-Step'
+    elif figure.startswith('tiklos'):
+        return 'Tiklos'
+    elif figure.startswith('binungey'):
+        return 'Binungey'
+    elif figure.startswith('pahid'):
+        return 'Pahid'
+    elif figure.startswith('suakusua'):
+        return 'Sua Ku Sua'
+    return None
+
+def score_response(accuracy, feedback):
+    """The JSON body /upload returns for a scored attempt."""
+    score = round(accuracy, 2) if accuracy is not None else 0  # Always a number
+    if score >= 81:
+        rating = "Excellent"
+        color = "green"
+    elif score >= 41:
+        rating = "Good"
+        color = "orange"
+    else:
+        rating = "Needs Improvement"
+        color = "red"
+
+    return {
+        'accuracy': score,
+        'rating': rating,
+        'color': color,
+        'message': f'Your dance accuracy is {score}%. {rating}!',
+        'feedback': {
+            'worst_landmarks': feedback['worst_landmarks'],
+            'frame_feedback': feedback['frame_feedback'],
+            'angle_errors': feedback.get('angle_errors', {}),
+            'body_part_feedback': feedback.get('body_part_feedback', []),
+            'no_body_detected': feedback.get('no_body_detected', False)
+        }
+    }
+
+def new_attempt_id(user_id, figure):
+    """The user_history id for an attempt that will be saved to history, or None if it won't be."""
+    return str(uuid.uuid4()) if user_id and figure and dance_name_for(figure) else None
+
+def record_attempt(user_id, figure, score, attempt_id=None):
+    """Bump the dance's play count and save the attempt to the user's history (written in the background)."""
+    dance_name = dance_name_for(figure)
+    if dance_name:
+        history_writer.record(user_id, dance_name, figure, score, attempt_id, scoring().SCORING_VERSION)
+
+def cached_result(digest, figure, attempt_id):
+    """An earlier upload's result for this video and figure, or None if the video has to be scored.
+
+    The new attempt shares the pose tracks saved for the earlier one, so rescore.py
+    can re-score it; a result whose tracks weren't kept is only reused for
+    attempts that don't keep any.
+    """
+    runtime = scoring()
+    cached = upload_store.get_result(digest, runtime.figure_key(figure), runtime.RESULT_CACHE_VERSION)
+    if cached is None:
+        return None
+    tracks_attempt_id = cached.pop('tracks_attempt_id', None)
+    if not runtime.link_tracks(tracks_attempt_id, attempt_id):
+        return None
+    return cached
+
+def cache_result(digest, figure, body, attempt_id):
+    """Cache an upload's result along with the attempt its pose tracks were saved under."""
+    runtime = scoring()
+    upload_store.put_result(digest, runtime.figure_key(figure), runtime.RESULT_CACHE_VERSION,
+                            dict(body, tracks_attempt_id=attempt_id))
+
+def score_video(video_path, figure, user_id, attempt_id=None):
+    """Score a saved video against a figure and record the attempt; returns (body, status)."""
+    # Look up the preloaded reference for this figure
+    reference = scoring().reference_store.get(figure)
+    if reference is None:
+        return {'error': f'Figure JSON not found: {figure}'}, 400
+
+    # ADD THIS LINE FOR NOTIFICATION
+    print(f"🔎 Comparing uploaded video to reference: {reference.name}")
+
+    # After processing the video
+    attempt_id = attempt_id or new_attempt_id(user_id, figure)
+    accuracy, feedback = scoring().process_video(video_path, reference, attempt_id=attempt_id)
+    body = score_response(accuracy, feedback)
+    record_attempt(user_id, figure, body['accuracy'], attempt_id)
+    return body, 200
+
 @app.route('/upload', methods=['POST'])
 def upload_video():
     try:
@@ -195,396 +378,411 @@ def upload_video():
         if not figure:
             return jsonify({'error': 'No figure specified'}), 400
 
-        video_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(video_path)
+        user_id = request.form.get('user_id')
+        with span('upload_save'):
+            digest, video_path = upload_store.save(file)
         print(f"📂 Video uploaded: {video_path}")
 
-        # Load the correct JSON for this figure
-        figure_json_path = os.path.join(os.path.dirname(__file__), 'dance_poses', figure)
-        if not os.path.exists(figure_json_path):
-            return jsonify({'error': f'Figure JSON not found: {figure}'}), 400
+        # Same video, figure and scoring version as an earlier upload: reuse its result
+        attempt_id = new_attempt_id(user_id, figure)
+        cached = cached_result(digest, figure, attempt_id)
+        if cached is not None:
+            print(f"⚡ Using cached result for {digest[:12]}")
+            record_attempt(user_id, figure, cached['accuracy'], attempt_id)
+            return jsonify(cached)
 
-        # ADD THIS LINE FOR NOTIFICATION
-        print(f"🔎 Comparing uploaded video to reference: {figure_json_path}")
-
-        with open(figure_json_path, 'r') as f:
-            dance_poses = json.load(f)
-            for pose in dance_poses:
-                if isinstance(pose, dict) and "landmarks" in pose:
-                    for landmark in pose["landmarks"]:
-                        landmark["z"] = landmark.get("z", 0.0) or 0.0
-
-        # After processing the video
-        accuracy, feedback = process_video(video_path, dance_poses)
-        score = round(accuracy, 2) if accuracy is not None else 0  # Always a number
-        # Determine dance_name from figure filename
-        dance_name = None
-        if figure.lower().startswith('tiklostut'):
-            dance_name = 'Tiklos: Step-by-Step'
-        elif figure.lower().startswith('tiklos'):
-            dance_name = 'Tiklos'
-        elif figure.lower().startswith('binungey'):
-            dance_name = 'Binungey'
-        elif figure.lower().startswith('pahid'):
-            dance_name = 'Pahid'
-        elif figure.lower().startswith('suakusua'):
-            dance_name = 'Sua Ku Sua'
-        # Increment the stat if it's a simulated dance
-        if dance_name:
-            increment_simulated_dance_stat(dance_name)
-
-        # Save user history
-        user_id = request.form.get('user_id')
-        figure_name = figure  # from the form
+        if request.form.get('mode', UPLOAD_MODE) == 'async':
+            return enqueue_upload(video_path, figure, user_id)
 
-        if user_id and dance_name and figure_name:
-            try:
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO user_history (user_id, dance_name, figure_name, score) VALUES (%s, %s, %s, %s)",
-                    (user_id, dance_name, figure_name, score)
-                )
-                conn.commit()
-                cursor.close()
-                conn.close()
-                print(f"✅ Saved user history for {user_id} - {dance_name} - {figure_name} - {score}")
-            except Exception as e:
-                print(f"❌ Error saving user history: {e}")
-
-        if score >= 81:
-            rating = "Excellent"
-            color = "green"
-        elif score >= 41:
-            rating = "Good"
-            color = "orange"
-        else:
-            rating = "Needs Improvement"
-            color = "red"
-
-        return jsonify({
-            'accuracy': score,
-            'rating': rating,
-            'color': color,
-            'message': f'Your dance accuracy is {score}%. {rating}!',
-            'feedback': {
-                'worst_landmarks': feedback['worst_landmarks'],
-                'frame_feedback': feedback['frame_feedback'],
-                'angle_errors': feedback.get('angle_errors', {}),
-                'body_part_feedback': feedback.get('body_part_feedback', []),
-                'no_body_detected': feedback.get('no_body_detected', False)
-            }
-        })
+        body, status = score_video(video_path, figure, user_id, attempt_id)
+        if status == 200:
+            cache_result(digest, figure, body, attempt_id)
+        return jsonify(body), status
 
     except Exception as e:
         print(f'❌ Upload Error: {e}')
         return jsonify({'error': 'An error occurred during video upload'}), 500
 
-def extract_pose_landmarks(landmarks):
-    if not landmarks or not landmarks.landmark:
-        return []
-
-    pose = []
-    visible_count = 0
-    for i in LANDMARK_IDS:
-        lm = landmarks.landmark[i]
-        if lm.visibility > 0.5:
-            x, y, z = lm.x, lm.y, lm.z or 0.0
-            visible_count += 1
-        else:
-            x, y, z = 0.0, 0.0, 0.0
-        pose.append((x, y, z))
-    # Only return pose if enough landmarks are visible
-    if visible_count < len(LANDMARK_IDS) // 2:
-        return []
-    return pose
-
-def dtw_score(user_poses, ref_poses):
-    user_vecs = [np.array(normalize_pose(p)).flatten() for p in user_poses]
-    ref_vecs = [np.array(normalize_pose(p)).flatten() for p in ref_poses]
-    distance, path = fastdtw(user_vecs, ref_vecs, dist=euclidean)
-    max_possible = len(path)
-    score = max(0, 1 - (distance / max_possible))
-    return score * 100
-
-def process_video(video_path, dance_poses):
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print("❌ Error: Could not open video.")
-        return 0.0, {
-            "worst_landmarks": [],
-            "frame_feedback": [],
-            "angle_errors": {},
-            "body_part_feedback": [],
-            "video_error": True,
-            "message": "Could not process the video file. Please try recording again."
-        }
+# Most videos one /batch_upload request may carry
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '50'))
 
-    mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose()
-    user_poses = []
-    user_poses_flipped = []
-
-    frame_skip = 5  # Match xyz.py (was 2)
-    frame_idx = 0
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        if frame_idx % frame_skip != 0:
-            frame_idx += 1
-            continue
-
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        # Process original
-        results = pose.process(frame_rgb)
-        if results.pose_landmarks:
-            extracted = extract_pose_landmarks(results.pose_landmarks)
-            if extracted:  # Only add if valid
-                user_poses.append(extracted)
-        # Process flipped
-        frame_rgb_flipped = cv2.flip(frame_rgb, 1)
-        results_flipped = pose.process(frame_rgb_flipped)
-        if results_flipped.pose_landmarks:
-            extracted_flipped = extract_pose_landmarks(results_flipped.pose_landmarks)
-            if extracted_flipped:  # Only add if valid
-                user_poses_flipped.append(extracted_flipped)
-
-        frame_idx += 1
-
-    cap.release()
-    print(f"📊 Total valid user poses extracted: {len(user_poses)} (normal), {len(user_poses_flipped)} (flipped)")
-
-    # Strict check: require at least 5 valid frames in either normal or flipped
-    if len(user_poses) < 5 and len(user_poses_flipped) < 5:
-        print("❌ No valid body detected in video.")
-        return 0.0, {
-            "worst_landmarks": [],
-            "frame_feedback": [],
-            "angle_errors": {},
-            "body_part_feedback": [],
-            "no_body_detected": True,
-            "message": "No body detected in the video. Please ensure you're visible in the frame and try again."
-        }
+def save_batch_history(plays):
+    """Write a batch's attempts and play counts in one transaction; queues them instead if that fails.
 
-    # --- MOVEMENT THRESHOLD CHECK ---
-    def movement_amount(poses):
-        if len(poses) < 2:
-            return 0.0
-        diffs = [
-            np.linalg.norm(np.array(normalize_pose(poses[i])) - np.array(normalize_pose(poses[i-1])))
-            for i in range(1, len(poses))
-        ]
-        return np.mean(diffs)
-
-    min_movement = 1.0  # <-- This is the threshold
-
-    user_movement = movement_amount(user_poses)
-    user_movement_flipped = movement_amount(user_poses_flipped)
-
-    if user_movement < min_movement and user_movement_flipped < min_movement:
-        print("❌ Not enough movement detected.")
-        return 0.0, {
-            "worst_landmarks": [],
-            "frame_feedback": [],
-            "angle_errors": {},
-            "body_part_feedback": [],
-            "no_movement_detected": True,
-            "message": "Not enough movement detected. Please perform the dance with more movement."
-        }
+    plays are history_writer.record() arguments, one per scored video: each
+    counts towards its dance's plays, and the ones with an attempt id are saved
+    to history, as /upload does.
+    """
+    rows = [play for play in plays if play[4]]
+    counts = {}
+    for play in plays:
+        counts[play[1]] = counts.get(play[1], 0) + 1
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            write_history(cursor, rows, counts)
+            conn.commit()
+            cursor.close()
+    except Exception as e:
+        print(f"⚠️ Batch history write failed, queueing {len(plays)} plays instead: {e}")
+        for play in plays:
+            history_writer.record(*play)
+        return 'queued'
+    invalidate_history_cache(rows)
+    return 'saved'
+
+@app.route('/batch_upload', methods=['POST'])
+def batch_upload():
+    """Score many videos at once, e.g. for an instructor reviewing a class.
+
+    Multipart form with `items`, a JSON list of {"file": <form field of the
+    video>, "figure", "user_id"} or {"upload": <sha256 of a video sent
+    before>, "figure", "user_id"}. Videos are scored in parallel on a process
+    pool (see batch_scoring.py) and every attempt is saved in one transaction.
+    `results` are in item order, each in the /upload shape plus index, figure
+    and user_id, or with an `error`; `stats` has the batch's throughput.
+    """
+    try:
+        started = time.perf_counter()
+        try:
+            items = json.loads(request.form.get('items') or 'null')
+        except ValueError:
+            items = None
+        if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+            return jsonify({'error': 'items must be a non-empty JSON list of objects'}), 400
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({'error': f'A batch can have at most {BATCH_MAX_ITEMS} videos'}), 400
+
+        runtime = scoring()
+        results = []
+        attempt_ids = []
+        pending = []  # (result, digest, video_path, figure, attempt_id)
+        with span('upload_save'):
+            for index, item in enumerate(items):
+                figure, user_id = item.get('figure'), item.get('user_id')
+                result = {'index': index, 'figure': figure, 'user_id': user_id}
+                results.append(result)
+                attempt_ids.append(new_attempt_id(user_id, figure))
+                if not figure or runtime.reference_store.get(figure) is None:
+                    result['error'] = f'Figure JSON not found: {figure}'
+                    continue
+                file = request.files.get(item['file']) if isinstance(item.get('file'), str) else None
+                if file and file.filename:
+                    digest, video_path = upload_store.save(file)
+                elif item.get('upload'):
+                    digest = str(item['upload']).lower()
+                    video_path = upload_store.find(digest)
+                    if video_path is None:
+                        result['error'] = 'Upload not found'
+                        continue
+                else:
+                    result['error'] = 'No file selected'
+                    continue
+                cached = cached_result(digest, figure, attempt_ids[index])
+                if cached is not None:
+                    result.update(cached, cached=True)
+                else:
+                    pending.append((result, digest, video_path, figure, attempt_ids[index]))
+
+        print(f"📦 Batch of {len(items)} videos: {len(pending)} to score with {batch_scoring.BATCH_WORKERS} processes")
+        scoring_seconds = 0.0
+        with span('batch_scoring'):
+            scored = batch_scoring.score_all([item[2:] for item in pending])
+        for (result, digest, _, figure, attempt_id), outcome in zip(pending, scored):
+            if outcome is None or isinstance(outcome, Exception):
+                print(f"❌ Batch item {result['index']} failed: {outcome}")
+                result['error'] = 'An error occurred while scoring this video'
+                continue
+            accuracy, feedback, seconds = outcome
+            scoring_seconds += seconds
+            body = score_response(accuracy, feedback)
+            cache_result(digest, figure, body, attempt_id)
+            result.update(body)
+
+        plays = []
+        for result, attempt_id in zip(results, attempt_ids):
+            dance_name = dance_name_for(result['figure']) if 'error' not in result else None
+            if dance_name:
+                plays.append((result['user_id'], dance_name, result['figure'],
+                              result['accuracy'], attempt_id, runtime.SCORING_VERSION))
+        history = save_batch_history(plays) if plays else 'none'
+
+        wall_seconds = time.perf_counter() - started
+        failed = sum(1 for result in results if 'error' in result)
+        return jsonify({
+            'results': results,
+            'history': history,
+            'stats': {
+                'videos': len(results),
+                'scored': len(pending) - sum(1 for item in pending if 'error' in item[0]),
+                'cached': sum(1 for result in results if result.get('cached')),
+                'failed': failed,
+                'workers': batch_scoring.BATCH_WORKERS,
+                'wall_seconds': round(wall_seconds, 3),
+                'scoring_seconds': round(scoring_seconds, 3),
+                'videos_per_second': round((len(results) - failed) / wall_seconds, 3) if wall_seconds else 0,
+            },
+        })
 
-    ref_poses = [extract_landmarks_by_id(pose["landmarks"], LANDMARK_IDS) for pose in dance_poses]
+    except Exception as e:
+        print(f'❌ Batch Upload Error: {e}')
+        return jsonify({'error': 'An error occurred while scoring the batch'}), 500
+
+def read_landmark_track(runtime):
+    """(figure, user_id, times, landmarks) from a JSON or packed track body; raises ValueError if malformed."""
+    if request.mimetype == 'application/octet-stream':
+        times, landmarks = runtime.parse_packed_track(request.get_data())
+        return request.args.get('figure'), request.args.get('user_id'), times, landmarks
+    data = request.get_json(silent=True) or {}
+    times, landmarks = runtime.parse_json_track(data.get('frames'))
+    return data.get('figure'), data.get('user_id'), times, landmarks
+
+@app.route('/score_landmarks', methods=['POST'])
+def score_landmarks():
+    """Score a landmark track extracted on the device; same response as /upload.
+
+    Send JSON ({"figure", "user_id", "frames"}) or a packed application/octet-stream
+    body with figure and user_id in the query string (see landmark_tracks.py).
+    """
+    try:
+        runtime = scoring()
+        try:
+            figure, user_id, times, landmarks = read_landmark_track(runtime)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid landmark track: {e}'}), 400
 
-    # DTW for best alignment
-    score_normal = dtw_score(user_poses, ref_poses) if user_poses else 0.0
-    score_flipped = dtw_score(user_poses_flipped, ref_poses) if user_poses_flipped else 0.0
+        if not figure:
+            return jsonify({'error': 'No figure specified'}), 400
+        reference = runtime.reference_store.get(figure)
+        if reference is None:
+            return jsonify({'error': f'Figure JSON not found: {figure}'}), 400
 
-    # Resample for feedback (to same length)
-    def resample_for_feedback(user_poses, ref_poses):
-        min_len = min(len(user_poses), len(ref_poses))
-        if min_len == 0:
-            return [], []
-        return resample_poses(user_poses, min_len), resample_poses(ref_poses, min_len)
+        print(f"🔎 Comparing {len(times)} uploaded landmark frames to reference: {reference.name}")
+        tracks = runtime.track_poses(times, landmarks)
+        attempt_id = new_attempt_id(user_id, figure)
+        runtime.save_tracks(attempt_id, tracks)
+        accuracy, feedback = runtime.score_pose_tracks(*tracks, reference)
+        body = score_response(accuracy, feedback)
+        record_attempt(user_id, figure, body['accuracy'], attempt_id)
+        return jsonify(body)
 
-    if score_flipped > score_normal:
-        print("🔄 Using flipped video for best score.")
-        user_poses_best, ref_poses_best = resample_for_feedback(user_poses_flipped, ref_poses)
-        score, feedback = compare_dance(user_poses_best, ref_poses_best)
-        return score, feedback
-    else:
-        user_poses_best, ref_poses_best = resample_for_feedback(user_poses, ref_poses)
-        score, feedback = compare_dance(user_poses_best, ref_poses_best)
-        return score, feedback
-
-def compare_dance(user_poses, ref_poses):
-    total_score, matched_frames = 0.0, 0
-    landmark_errors = {lid: [] for lid in LANDMARK_IDS}
-    frame_feedback = []
-    frame_scores = []
-
-    # --- Angle heuristics ---
-    angle_errors = []
-
-    for i, (user_pose, ref_pose) in enumerate(zip(user_poses, ref_poses)):
-        user_pose_arr = np.array(normalize_pose(user_pose))
-        ref_pose_arr = np.array(normalize_pose(ref_pose))
-        differences = np.linalg.norm(user_pose_arr - ref_pose_arr, axis=1)
-        avg_difference = np.mean(differences)
-        threshold = 0.9
-        if avg_difference < threshold:
-            score = 1.0
-        else:
-            score = max(0, 1 - (avg_difference - threshold))
-        errors = {LANDMARK_IDS[idx]: float(diff) for idx, diff in enumerate(differences)}
-        total_score += score
-        matched_frames += 1
-        frame_feedback.append(errors)
-        frame_scores.append(avg_difference)
-        for lid, err in errors.items():
-            landmark_errors[lid].append(err)
-
-        # --- Angle error computation ---
-        user_angles = get_joint_angles(user_pose)
-        ref_angles = get_joint_angles(ref_pose)
-        frame_angle_errors = {}
-        for k in user_angles:
-            if k in ref_angles:
-                frame_angle_errors[k] = abs(user_angles[k] - ref_angles[k])
-        angle_errors.append(frame_angle_errors)
-
-    avg_landmark_errors = {LANDMARK_NAMES.get(lid, str(lid)): np.mean(vals) if vals else 0.0
-                           for lid, vals in landmark_errors.items()}
-    worst_landmarks = sorted(avg_landmark_errors.items(), key=lambda x: -x[1])
-
-    # Only return top 3 worst frames
-    sorted_feedback = sorted(zip(frame_scores, frame_feedback), key=lambda x: -x[0])
-    top_feedback = [fb for _, fb in sorted_feedback[:3]]
-
-    # --- Angle feedback: average error per angle ---
-    avg_angle_errors = {}
-    if angle_errors:
-        angle_keys = angle_errors[0].keys()
-        for k in angle_keys:
-            vals = [ae.get(k, 0.0) for ae in angle_errors if k in ae]
-            if vals:
-                avg_angle_errors[k] = float(np.mean(vals))
-
-    # --- Body part specific, time-stamped feedback ---
-    fps = 30  # Or get from video metadata if available
-    frame_skip = 2  # Should match your process_video
-    body_part_feedback = []
-    for idx, (frame_score, frame) in enumerate(sorted(zip(frame_scores, frame_feedback), key=lambda x: -x[0])[:3]):
-        if not frame:
-            continue
-        worst_lid = max(frame, key=frame.get)
-        part_name = LANDMARK_NAMES.get(worst_lid, f"Landmark {worst_lid}")
-        time_sec = (idx * frame_skip) / fps
-        body_part_feedback.append(
-            f"At {time_sec:.1f}s, your {part_name.lower()} needs improvement."
-        )
-
-    feedback = {
-        "worst_landmarks": worst_landmarks[:3],
-        "frame_feedback": top_feedback,
-        "angle_errors": avg_angle_errors,
-        "body_part_feedback": body_part_feedback  # <-- Add this line
-    }
+    except Exception as e:
+        print(f'❌ Landmark Scoring Error: {e}')
+        return jsonify({'error': 'An error occurred while scoring the landmarks'}), 500
 
-    return (total_score / matched_frames) * 100 if matched_frames else 0.0, feedback
+@app.route('/recognize', methods=['POST'])
+def recognize_figure():
+    """Work out which reference figures a performance matches, best first, and score the best one.
 
-def compare_poses(pose1, pose2, return_errors=False):
-    if not pose1 or not pose2:
-        return (0.0, {}) if return_errors else 0.0
+    Send a video as multipart `file` (with user_id in the form), or a landmark
+    track like /score_landmarks without a figure. `top_k` sets how many matches
+    come back. `best` is the full /upload-style result for the top match.
+    """
+    try:
+        runtime = scoring()
+        try:
+            top_k = min(max(int(request.values.get('top_k', 3)), 1), 10)
+        except ValueError:
+            return jsonify({'error': 'top_k must be a number'}), 400
+        file = request.files.get('file')
+        if file and file.filename:
+            user_id = request.form.get('user_id')
+            with span('upload_save'):
+                _, video_path = upload_store.save(file)
+            tracks = runtime.extract_video_tracks(video_path)
+            if tracks is None:
+                return jsonify({'error': 'Could not process the video file. Please try recording again.'}), 400
+        else:
+            try:
+                _, user_id, times, landmarks = read_landmark_track(runtime)
+            except ValueError as e:
+                return jsonify({'error': f'Invalid landmark track: {e}'}), 400
+            tracks = runtime.track_poses(times, landmarks)
+
+        matches, search = runtime.recognize_tracks(*tracks, top_k=top_k)
+        best = None
+        if matches:
+            figure = matches[0]['figure'] + '.json'
+            print(f"🧭 Recognized {figure} ({search['exact_dtw']} of {search['candidates']} candidates aligned)")
+            accuracy, feedback = runtime.score_pose_tracks(*tracks, runtime.reference_store.get(figure))
+            best = dict(score_response(accuracy, feedback), figure=figure)
+            attempt_id = new_attempt_id(user_id, figure)
+            runtime.save_tracks(attempt_id, tracks)
+            record_attempt(user_id, figure, best['accuracy'], attempt_id)
+        return jsonify({'matches': matches, 'best': best, 'search': search})
 
-    pose1 = np.array(normalize_pose(pose1))
-    pose2 = np.array(normalize_pose(pose2))
+    except Exception as e:
+        print(f'❌ Recognition Error: {e}')
+        return jsonify({'error': 'An error occurred while recognizing the figure'}), 500
 
-    min_length = min(len(pose1), len(pose2))
-    pose1, pose2 = pose1[:min_length], pose2[:min_length]
+# A /live stream with no message for this long is closed
+LIVE_IDLE_TIMEOUT = float(os.getenv('LIVE_IDLE_TIMEOUT', '30'))  # seconds
 
-    differences = np.linalg.norm(pose1 - pose2, axis=1)
-    avg_difference = np.mean(differences)
-    threshold = 0.9  # More lenient
-    similarity_score = max(0, 1 - (avg_difference / threshold))
+def live_scoring(ws):
+    """Score a performance while it's recorded: WebSocket /live?figure=...&user_id=...
 
-    # Per-landmark error (by index in LANDMARK_IDS order)
-    errors = {list(LANDMARK_IDS)[idx]: float(diff) for idx, diff in enumerate(differences)}
+    Send landmark chunks as text ({"frames": [...]} like /score_landmarks) or
+    packed binary tracks, or video frames as binary (see live_scoring.py).
+    Every message is answered with a progress message (running score, figure
+    progress, hint). Send {"type": "end"} to get the final /upload-style result
+    as {"type": "final", ...}; errors come back as {"type": "error"}.
+    """
+    runtime = scoring()
+    figure = request.args.get('figure')
+    user_id = request.args.get('user_id')
+    reference = runtime.reference_store.get(figure) if figure else None
+    if reference is None:
+        ws.send(json.dumps({'type': 'error', 'error': f'Figure JSON not found: {figure}'}))
+        return
 
-    if return_errors:
-        return similarity_score, errors
-    else:
-        return similarity_score
-
-def normalize_pose(pose):
-    if not pose or len(pose) < 2:
-        return []
-
-    # Use shoulders (index 1 and 2) as center
-    center_x = (pose[1][0] + pose[2][0]) / 2
-    center_y = (pose[1][1] + pose[2][1]) / 2
-    center_z = (pose[1][2] + pose[2][2]) / 2
-
-    # Use distance between shoulders for scale (3D)
-    scale = np.linalg.norm(np.array(pose[1]) - np.array(pose[2]))
-    if scale == 0:
-        scale = 1.0
-
-    normalized_pose = []
-    for (x, y, z) in pose:
-        norm_x = (x - center_x) / scale
-        norm_y = (y - center_y) / scale
-        norm_z = (z - center_z) / scale
-        normalized_pose.append((norm_x, norm_y, norm_z))
-    return normalized_pose
-
-def increment_simulated_dance_stat(dance_name):
+    session = runtime.live_session(reference)
+    print(f"📡 Live scoring started for {reference.name}")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO simulated_dance_stats (dance_name, performed_count)
-            VALUES (%s, 1)
-            ON CONFLICT (dance_name)
-            DO UPDATE SET performed_count = simulated_dance_stats.performed_count + 1
-        """, (dance_name,))
-        conn.commit()
-        cursor.close()
-        cursor.close()
-    except Exception as e:
-        print(f"❌ Error incrementing dance stat: {e}")
+        while True:
+            message = ws.receive(timeout=LIVE_IDLE_TIMEOUT)
+            if message is None:
+                ws.send(json.dumps({'type': 'error', 'error': 'Stream timed out'}))
+                return
+            try:
+                if isinstance(message, bytes):
+                    if message[:len(runtime.TRACK_MAGIC)] == runtime.TRACK_MAGIC:
+                        session.add_landmarks(*runtime.parse_packed_track(message))
+                    else:
+                        session.add_video_frame(message)
+                else:
+                    data = json.loads(message)
+                    if not isinstance(data, dict):
+                        raise ValueError("Messages must be JSON objects")
+                    if data.get('type') == 'end':
+                        break
+                    session.add_landmarks(*runtime.parse_json_track(data.get('frames')))
+            except ValueError as e:
+                ws.send(json.dumps({'type': 'error', 'error': f'Invalid frames: {e}'}))
+                continue
+            ws.send(json.dumps(session.progress()))
+    finally:
+        session.close()  # the pose estimator goes back to the pool before the final scoring
 
+    try:
+        with span('live_final'):
+            accuracy, feedback = runtime.score_pose_tracks(*session.pose_tracks(), reference,
+                                                           alignments=session.alignments())
+        body = score_response(accuracy, feedback)
+        attempt_id = new_attempt_id(user_id, figure)
+        runtime.save_tracks(attempt_id, session.pose_tracks())
+        record_attempt(user_id, figure, body['accuracy'], attempt_id)
+        print(f"📡 Live scoring finished for {reference.name}: {session.frames_received} frames, {body['accuracy']}%")
+        ws.send(json.dumps(dict(body, type='final')))
+    except Exception as e:
+        print(f'❌ Live Scoring Error: {e}')
+        ws.send(json.dumps({'type': 'error', 'error': 'An error occurred while scoring the performance'}))
+
+if sock is not None:
+    sock.route('/live')(live_scoring)
+
+def enqueue_upload(video_path, figure, user_id):
+    """Job mode: store the video in the queue and hand back a job ID right away."""
+    if scoring().reference_store.get(figure) is None:
+        return jsonify({'error': f'Figure JSON not found: {figure}'}), 400
+
+    with open(video_path, 'rb') as f:
+        video_bytes = f.read()
+    with db_connection() as conn:
+        job_id = enqueue_job(conn, figure, user_id, video_bytes, max_depth=MAX_QUEUE_DEPTH)
+    if job_id is None:
+        print("⚠️ Scoring queue full, rejecting upload")
+        response = jsonify({'error': 'Too many videos are waiting to be scored. Please try again shortly.'})
+        response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+        return response, 429
+    print(f"📥 Queued scoring job {job_id} for {figure}")
+    return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': f'/jobs/{job_id}'}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_scoring_job(job_id):
+    if not is_job_id(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    try:
+        with db_connection() as conn:
+            job = get_job(conn, job_id)
+    except Exception as e:
+        print(f"❌ Error fetching job {job_id}: {e}")
+        return jsonify({'error': 'Database error'}), 500
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
 
 @app.route('/user_history', methods=['GET'])
 def get_user_history():
+    """A user's attempts, newest first. Optional dance_name / figure_name filters;
+    pass back next_cursor as `cursor` for the following page of `limit` rows."""
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'Missing user_id'}), 400
+    dance_name = request.args.get('dance_name') or None
+    figure_name = request.args.get('figure_name') or None
+    cursor = request.args.get('cursor') or None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT dance_name, figure_name, score, attempted_at
-            FROM user_history
-            WHERE user_id = %s
-            ORDER BY attempted_at DESC
-            LIMIT 20
-        """, (user_id,))
-        latest_scores = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return jsonify({
-            'latest_scores': [
-                {
-                    'dance_name': row[0],
-                    'figure_name': row[1],
-                    'score': row[2],
-                    'attempted_at': row[3].isoformat()
-                } for row in latest_scores
-            ]
-        })
-    except Exception as e:
-        print(f"❌ Error fetching user history: {e}")
-        return jsonify({'error': 'Database error'}), 500
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    # Attempts still waiting in this process's write-behind buffer should show up right away
+    if history_writer.has_pending(user_id):
+        history_writer.flush(timeout=2.0)
+
+    cache_key = (dance_name, figure_name, cursor, limit)
+    body = history_cache.get(user_id, cache_key)
+    if body is None:
+        try:
+            with db_connection() as conn:
+                latest_scores, next_cursor = fetch_history(conn, user_id, dance_name, figure_name, cursor, limit)
+        except Exception as e:
+            print(f"❌ Error fetching user history: {e}")
+            return jsonify({'error': 'Database error'}), 500
+        body = {'latest_scores': latest_scores, 'next_cursor': next_cursor}
+        history_cache.put(user_id, cache_key, body)
+    return jsonify(body)
+
+@app.route('/progress', methods=['GET'])
+def get_progress():
+    """A user's progress per dance and per figure: attempts, best, latest and average score, last attempt.
+
+    Optional dance_name filter. Served from the progress rollups, not by scanning user_history.
+    """
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Missing user_id'}), 400
+    dance_name = request.args.get('dance_name') or None
+
+    if history_writer.has_pending(user_id):
+        history_writer.flush(timeout=2.0)
+
+    body = progress_cache.get(user_id, dance_name)
+    if body is None:
+        try:
+            with db_connection() as conn:
+                dances = fetch_progress(conn, user_id, dance_name)
+        except Exception as e:
+            print(f"❌ Error fetching progress: {e}")
+            return jsonify({'error': 'Database error'}), 500
+        body = {'dances': dances}
+        progress_cache.put(user_id, dance_name, body)
+    return jsonify(body)
+
+@app.route('/pose_pool_stats', methods=['GET'])
+def get_pose_pool_stats():
+    runtime = scoring()
+    return jsonify(dict(runtime.pose_pool.stats(), live_sessions=runtime.live_pose_pool.stats()))
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/db_pool_stats', methods=['GET'])
+def get_db_pool_stats():
+    return jsonify(dict(db_pool.stats(), history_writer=history_writer.stats()))
 
 @app.route('/feedback', methods=['POST'])
 def submit_feedback():
@@ -598,69 +796,18 @@ def submit_feedback():
         if not user_id or not figure_name or rating is None:
             return jsonify({'error': 'Missing required fields'}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO user_feedback (user_id, figure_name, rating, text_feedback) VALUES (%s, %s, %s, %s)",
-            (user_id, figure_name, rating, text_feedback)
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO user_feedback (user_id, figure_name, rating, text_feedback) VALUES (%s, %s, %s, %s)",
+                (user_id, figure_name, rating, text_feedback)
+            )
+            conn.commit()
+            cursor.close()
         return jsonify({'message': 'Feedback submitted!'}), 201
     except Exception as e:
         print(f"❌ Error saving feedback: {e}")
         return jsonify({'error': 'Database error'}), 500
 
-def extract_landmarks_by_id(landmarks, ids):
-    id_map = {lm.get('id'): lm for lm in landmarks if 'id' in lm}
-    return [
-        (id_map.get(i, {'x': 0.0, 'y': 0.0, 'z': 0.0}).get('x', 0.0),
-         id_map.get(i, {'x': 0.0, 'y': 0.0, 'z': 0.0}).get('y', 0.0),
-         id_map.get(i, {'x': 0.0, 'y': 0.0, 'z': 0.0}).get('z', 0.0))
-        for i in LANDMARK_IDS
-    ]
-
-# --- ANGLE HEURISTICS UTILS ---
-
-def calculate_angle(a, b, c):
-    """Calculate the angle (in degrees) at point b given three points a, b, c."""
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
-    ba = a - b
-    bc = c - b
-    cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc) + 1e-8)
-    angle = np.arccos(np.clip(cosine_angle, -1.0, 1.0))
-    return np.degrees(angle)
-
-def get_joint_angles(pose):
-    """Given a pose (list of (x, y, z)), return a dict of key joint angles."""
-    angles = {}
-    try:
-        # Left side: LShoulder-LHip-LAnkle
-        angles['left_hip'] = calculate_angle(pose[1], pose[3], pose[5])
-        # Right side: RShoulder-RHip-RAnkle
-        angles['right_hip'] = calculate_angle(pose[2], pose[4], pose[6])
-        # Shoulder angle (nose-shoulder-hip)
-        angles['left_shoulder'] = calculate_angle(pose[0], pose[1], pose[3])
-        angles['right_shoulder'] = calculate_angle(pose[0], pose[2], pose[4])
-        # Hip spread (LHip-Nose-RHip)
-        angles['hip_spread'] = calculate_angle(pose[3], pose[0], pose[4])
-    except Exception as e:
-        pass
-    return angles
-
-def resample_poses(poses, target_length):
-    """
-    Resample a list of poses to the target length by linear interpolation of indices.
-    """
-    if len(poses) == target_length:
-        return poses
-    if len(poses) == 0 or target_length == 0:
-        return []
-    idxs = np.linspace(0, len(poses) - 1, target_length).astype(int)
-    return [poses[i] for i in idxs]
-
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5003)  # Change port if needed
\ No newline at end of file
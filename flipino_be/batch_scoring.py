@@ -0,0 +1,94 @@
+"""Score many saved videos at once on a pool of processes, for /batch_upload.
+
+Pose inference holds the GIL for much of each frame, so a batch fans out over
+processes rather than threads, one video at a time per process. Each process
+loads the scoring stack once and keeps one pose estimator; reference figures
+come from the memory-mapped pack, so every process reads the same single copy
+from the page cache instead of parsing its own. The pack isn't checked in:
+it's built before the pool starts when it's missing, and rebuilt when a
+figure's JSON changed since.
+
+The pool is started on the first batch with the spawn method (the web process
+runs threads, and MediaPipe may already be running in it, so forking is not
+safe) and is reused for later batches.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '0')) or os.cpu_count() or 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_worker():
+    import scoring_service
+    # One video at a time per process, so one warm estimator is all it needs
+    with scoring_service.pose_pool.acquire():
+        pass
+
+
+def score_file(video_path, figure, attempt_id=None):
+    """Runs in a pool process: (accuracy, feedback, seconds), or None if the figure is unknown.
+
+    With an attempt_id the pose tracks are saved for rescore.py, as /upload does.
+    """
+    import scoring_service
+    reference = scoring_service.reference_store.get(figure)
+    if reference is None:
+        return None
+    start = time.perf_counter()
+    accuracy, feedback = scoring_service.process_video(video_path, reference, attempt_id=attempt_id)
+    return accuracy, feedback, time.perf_counter() - start
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import scoring_service
+            scoring_service.ensure_reference_pack()
+            _pool = concurrent.futures.ProcessPoolExecutor(max_workers=BATCH_WORKERS,
+                                                           mp_context=multiprocessing.get_context('spawn'),
+                                                           initializer=init_worker)
+        return _pool
+
+
+def score_all(items):
+    """Score [(video_path, figure, attempt_id), ...] in parallel; results in the same order.
+
+    Each result is (accuracy, feedback, seconds), None for an unknown figure,
+    or the exception that scoring that video raised.
+    """
+    pool = get_pool()
+    futures = [pool.submit(score_file, *item) for item in items]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except concurrent.futures.process.BrokenProcessPool as e:
+            # A crashed process (e.g. out of memory) breaks the whole pool; start a new one next time
+            discard(pool)
+            results.append(e)
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def discard(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
@@ -0,0 +1,235 @@
+"""Benchmark the scoring pipeline stage by stage: decode, inference, normalization, DTW and feedback.
+
+Fixtures are the recordings in uploads/ scored against a reference figure,
+plus synthetic recordings of increasing length built from the same figure
+(time-warped, repeated and jittered) to show how scoring scales with length.
+Video cases can be repeated with several inference inputs (--inference-inputs
+0 640 480:0.25 for full resolution, a 640 px cap, and a 480 px cap cropped to
+the dancer with a 25% margin); each reports its score drift from the first.
+Recognition cases time the pruned figure search against exact DTW on every
+figure for synthetic recordings of a few figures, and check they agree.
+Each case runs --repeat times and reports the median seconds per stage.
+
+    python bench.py [--figure TiklosBoyFig1.json] [--lengths 10 30 60 120] [--recognize 4] [--out bench.json]
+    python bench.py --compare bench.json    # exit 1 on slower stages or changed scores
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from extractor import ExtractionStats, sampled_frames
+from landmark_tracks import MIRROR_ORDER
+from pose_pool import PoseModelUnavailable
+from scoring import POSES_PER_SECOND, as_pose_array, normalize_poses
+# Progress logging (here and while benchmarking) goes to stderr so stdout stays valid JSON
+with contextlib.redirect_stdout(sys.stderr):
+    from scoring_service import (DTW_BAND, MAX_INFERENCE_DIM, RECOGNIZE_BAND, ROI_MARGIN, SAMPLE_POSES_PER_SECOND,
+                                 figure_index, process_video, reference_store, score_pose_tracks)
+
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+
+STAGES = ['decode', 'inference', 'normalization', 'dtw', 'feedback', 'recognize', 'recognize_exhaustive']
+
+
+def median_run(fn, repeat):
+    """Run fn() `repeat` times; returns (median stage times, total seconds, last accuracy)."""
+    runs, totals, accuracy = [], [], None
+    for _ in range(repeat):
+        stage_times = {}
+        start = time.perf_counter()
+        accuracy = fn(stage_times)
+        totals.append(time.perf_counter() - start)
+        runs.append(stage_times)
+    stages = {stage: round(statistics.median(run[stage] for run in runs), 6)
+              for stage in STAGES if all(stage in run for run in runs)}
+    return stages, round(statistics.median(totals), 6), accuracy
+
+
+def decode_only(video_path):
+    """Time frame sampling alone, for machines where pose inference can't run."""
+    cap = cv2.VideoCapture(video_path)
+    stats = ExtractionStats()
+    try:
+        sampled = sum(1 for _ in sampled_frames(cap, SAMPLE_POSES_PER_SECOND, stats))
+    finally:
+        cap.release()
+    return stats.decode_seconds, sampled
+
+
+def parse_inference_input(spec):
+    """'640' or '640:0.25' -> (max_dim, roi_margin); 'default' -> the server's settings."""
+    if spec == 'default':
+        return MAX_INFERENCE_DIM, ROI_MARGIN
+    max_dim, _, margin = spec.partition(':')
+    return int(max_dim), float(margin or 0)
+
+
+def bench_video(video_path, reference, repeat, max_dim=None, roi_margin=None):
+    case = {"kind": "video", "name": os.path.basename(video_path)}
+    if max_dim is not None:
+        case.update(name=f"{case['name']} @ {max_dim or 'full'}{f' roi {roi_margin:g}' if roi_margin else ''}",
+                    max_inference_dim=max_dim, roi_margin=roi_margin)
+    try:
+        def run(stage_times):
+            accuracy, _ = process_video(video_path, reference, stage_times=stage_times,
+                                        max_dim=max_dim, roi_margin=roi_margin)
+            return round(accuracy, 6)
+        case["stages"], case["total"], case["accuracy"] = median_run(run, repeat)
+    except PoseModelUnavailable as e:
+        # No usable pose model here: still measure decoding so that part stays comparable
+        print(f"⚠️ {case['name']}: {e}; timing decoding only")
+        seconds, sampled = decode_only(video_path)
+        case.update(stages={"decode": round(seconds, 6)}, total=round(seconds, 6), accuracy=None,
+                    frames_sampled=sampled, skipped=f"pose inference unavailable: {e}")
+    return case
+
+
+def synthetic_track(reference, seconds, seed=0):
+    """A plausible user recording `seconds` long: the figure, time-warped, repeated and jittered."""
+    rng = np.random.default_rng(seed)
+    frames = max(int(seconds * POSES_PER_SECOND), 5)
+    poses = reference.poses.astype(np.float64)
+    # Smooth speed changes while looping over the reference
+    speed = 1.0 + 0.3 * np.sin(np.linspace(0, 6 * np.pi, frames) + rng.uniform(0, np.pi))
+    position = np.cumsum(speed) * (len(poses) / (POSES_PER_SECOND * 10.0))
+    idx = np.mod(position, len(poses) - 1)
+    lo = np.floor(idx).astype(int)
+    frac = (idx - lo)[:, None, None]
+    track = poses[lo] * (1 - frac) + poses[lo + 1] * frac
+    track += rng.normal(scale=0.01, size=track.shape)
+    track[poses[lo] == 0] = 0.0  # keep landmarks that were missing in the reference missing
+    mirrored = track[:, MIRROR_ORDER].copy()
+    mirrored[:, :, 0] = np.where(mirrored[:, :, 0] != 0, 1.0 - mirrored[:, :, 0], 0.0)
+    times = list(np.arange(frames) / POSES_PER_SECOND)
+    return track, times, mirrored, times
+
+
+def bench_synthetic(reference, seconds, repeat):
+    track = synthetic_track(reference, seconds)
+
+    def run(stage_times):
+        accuracy, _ = score_pose_tracks(*track, reference, stage_times=stage_times)
+        return round(accuracy, 6)
+    case = {"kind": "synthetic", "name": f"{seconds:g}s", "frames": len(track[0])}
+    case["stages"], case["total"], case["accuracy"] = median_run(run, repeat)
+    return case
+
+
+def bench_recognition(name, repeat):
+    """Pruned search vs exact DTW against every figure, for a 10 s recording of `name`."""
+    track, _, mirrored, _ = synthetic_track(reference_store.get(name), 10)
+    queries = {'normal': normalize_poses(as_pose_array(track)), 'flipped': normalize_poses(as_pose_array(mirrored))}
+    results = {}
+
+    def run(stage_times):
+        for stage, prune in (('recognize', True), ('recognize_exhaustive', False)):
+            start = time.perf_counter()
+            results[stage] = figure_index.search(queries, prune=prune)
+            stage_times[stage] = time.perf_counter() - start
+        return None
+    case = {"kind": "recognize", "name": name}
+    case["stages"], case["total"], case["accuracy"] = median_run(run, repeat)
+    (matches, search), (exhaustive, _) = results['recognize'], results['recognize_exhaustive']
+    case.update(top_match=matches[0]["figure"] if matches else None, identical=matches == exhaustive, **search)
+    return case
+
+
+def compare(results, baseline, tolerance, min_delta):
+    """Regressions and score changes of results against a baseline run."""
+    problems = []
+    previous = {(case["kind"], case["name"]): case for case in baseline["cases"]}
+    for case in results["cases"]:
+        old = previous.get((case["kind"], case["name"]))
+        if old is None:
+            continue
+        label = f"{case['kind']} {case['name']}"
+        for stage, seconds in case["stages"].items():
+            before = old["stages"].get(stage)
+            if before is not None and seconds > before * (1 + tolerance) and seconds - before > min_delta:
+                problems.append(f"{label}: {stage} {before:.4f}s -> {seconds:.4f}s")
+        if case.get("identical") is False:
+            problems.append(f"{label}: pruned search disagrees with exact DTW")
+        if case["accuracy"] is None and old.get("accuracy") is not None:
+            problems.append(f"{label}: scored in the baseline but not now ({case.get('skipped', 'no score')})")
+        if case["accuracy"] is not None and old.get("accuracy") is not None \
+                and abs(case["accuracy"] - old["accuracy"]) > 1e-4:
+            problems.append(f"{label}: score changed {old['accuracy']} -> {case['accuracy']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--figure', default='TiklosBoyFig1.json', help="reference figure to score against")
+    parser.add_argument('--videos', default=UPLOAD_FOLDER, help="folder of .mp4 recordings ('' to skip)")
+    parser.add_argument('--inference-inputs', nargs='*', default=['default'],
+                        help="max inference dim[:roi margin] per video run, e.g. 0 640 480:0.25 ('default': server settings)")
+    parser.add_argument('--lengths', type=float, nargs='*', default=[10, 30, 60, 120],
+                        help="synthetic recording lengths in seconds")
+    parser.add_argument('--recognize', type=int, default=4, help="figures to run recognition cases for (0 to skip)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case; the median is reported")
+    parser.add_argument('--out', help="write the results JSON here (default: stdout)")
+    parser.add_argument('--compare', help="baseline results JSON to check against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown per stage, as a fraction")
+    parser.add_argument('--min-delta', type=float, default=0.005, help="ignore slowdowns under this many seconds")
+    args = parser.parse_args()
+
+    reference = reference_store.get(args.figure)
+    if reference is None:
+        raise SystemExit(f"Unknown figure: {args.figure}")
+
+    cases = []
+    with contextlib.redirect_stdout(sys.stderr):
+        # A single input keeps the plain case names, so older baselines still compare
+        inputs = [parse_inference_input(spec) for spec in args.inference_inputs] \
+            if len(args.inference_inputs) > 1 else [(None, None)]
+        for video_path in sorted(glob.glob(os.path.join(args.videos, '*.mp4'))) if args.videos else []:
+            runs = [bench_video(video_path, reference, args.repeat, *inference_input) for inference_input in inputs]
+            for case in runs[1:]:
+                if case["accuracy"] is not None and runs[0]["accuracy"] is not None:
+                    case["score_drift"] = round(case["accuracy"] - runs[0]["accuracy"], 6)
+            cases.extend(runs)
+        for seconds in args.lengths:
+            cases.append(bench_synthetic(reference, seconds, args.repeat))
+        names = reference_store.names()
+        for name in names[::max(len(names) // args.recognize, 1)][:args.recognize] if args.recognize > 0 else []:
+            cases.append(bench_recognition(name, args.repeat))
+
+    results = {
+        "figure": args.figure,
+        "dtw_band": DTW_BAND,
+        "recognize_band": RECOGNIZE_BAND,
+        "poses_per_second": SAMPLE_POSES_PER_SECOND,
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "cases": cases,
+    }
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            problems = compare(results, json.load(f), args.tolerance, args.min_delta)
+        for problem in problems:
+            print(f"❌ {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+        print("✅ No stage regressions and scores unchanged", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
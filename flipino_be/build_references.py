@@ -0,0 +1,160 @@
+"""Build reference figures from a folder of reference videos (replaces xyz.py).
+
+Every video becomes dance_poses/<video name>.json, extracted with the
+server's landmark set, time-based sampling and visibility rules, and all
+figures are then written to the packed serving file. Videos are processed in
+parallel, one MediaPipe estimator per process, and a video is skipped when
+its content hash and the extraction settings match the manifest from the
+last build.
+
+    python build_references.py path/to/reference_videos [--workers 8] [--force]
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import time
+
+import cv2
+
+from extractor import ExtractionStats, extract_pose_landmarks, sampled_frames
+from pose_pool import default_pose_factory
+from reference_store import ReferenceStore, write_pack
+from scoring import LANDMARK_IDS, POSES_PER_SECOND
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.avi')
+
+_pose = None  # one estimator per pool process
+
+
+def extraction_settings(model_complexity, poses_per_second):
+    """Everything that changes the extracted poses; a change rebuilds every figure."""
+    return {
+        "landmark_ids": list(LANDMARK_IDS),
+        "poses_per_second": poses_per_second,
+        "model_complexity": model_complexity,
+        "visibility_threshold": 0.5,
+    }
+
+
+def video_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def init_worker(model_complexity):
+    global _pose
+    _pose = default_pose_factory(model_complexity)
+
+
+def extract_figure(video_path, poses_per_second):
+    """Runs in a pool process: returns (frames, stats) with frames as the figure JSON list."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {video_path}")
+    if hasattr(_pose, 'reset'):
+        _pose.reset()  # no tracking state carried over from the previous video
+    stats = ExtractionStats()
+    frames = []
+    try:
+        for timestamp, frame in sampled_frames(cap, poses_per_second, stats):
+            results = _pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            pose = extract_pose_landmarks(results.pose_landmarks) if results.pose_landmarks else []
+            if not pose:
+                continue
+            frames.append({
+                "frame": stats.frames_decoded - 1,
+                "time": round(timestamp, 3),
+                "landmarks": [{"id": lid, "x": round(x, 5), "y": round(y, 5), "z": round(z, 5)}
+                              for lid, (x, y, z) in zip(LANDMARK_IDS, pose)],
+            })
+    finally:
+        cap.release()
+    return frames, stats.as_dict()
+
+
+def write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"settings": None, "figures": {}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('videos', help="folder of reference videos named after their figure, e.g. TiklosBoyFig4.mp4")
+    parser.add_argument('--out', default=os.path.join(HERE, 'dance_poses'), help="figure JSON folder to update")
+    parser.add_argument('--pack', default=os.path.join(HERE, 'dance_poses.pack'), help="packed file to write")
+    parser.add_argument('--manifest', default=os.path.join(HERE, 'dance_poses.manifest.json'),
+                        help="hashes of the videos each figure was built from")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="extraction processes")
+    parser.add_argument('--model-complexity', type=int, default=int(os.getenv('POSE_MODEL_COMPLEXITY', '1')))
+    parser.add_argument('--poses-per-second', type=float, default=float(os.getenv('POSES_PER_SECOND', POSES_PER_SECOND)))
+    parser.add_argument('--force', action='store_true', help="rebuild every figure")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    settings = extraction_settings(args.model_complexity, args.poses_per_second)
+    manifest = load_manifest(args.manifest)
+    if manifest.get("settings") != settings:
+        if manifest.get("settings") is not None:
+            print("🔄 Extraction settings changed since the last build; rebuilding every figure")
+        manifest = {"settings": settings, "figures": {}}
+
+    todo = []
+    videos = sorted(f for f in os.listdir(args.videos) if f.lower().endswith(VIDEO_EXTENSIONS))
+    for filename in videos:
+        name = os.path.splitext(filename)[0]
+        path = os.path.join(args.videos, filename)
+        digest = video_digest(path)
+        built = manifest["figures"].get(name, {})
+        if not args.force and built.get("video_sha256") == digest and os.path.exists(os.path.join(args.out, name + '.json')):
+            continue
+        todo.append((name, path, digest))
+    print(f"🎞️ {len(videos)} reference videos, {len(todo)} to extract with {args.workers} workers")
+
+    started = time.perf_counter()
+    failed = []
+    if todo:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(args.workers, len(todo)),
+                                                    initializer=init_worker,
+                                                    initargs=(args.model_complexity,)) as pool:
+            futures = {pool.submit(extract_figure, path, args.poses_per_second): (name, digest)
+                       for name, path, digest in todo}
+            for future in concurrent.futures.as_completed(futures):
+                name, digest = futures[future]
+                try:
+                    frames, stats = future.result()
+                except Exception as e:
+                    print(f"❌ {name}: {e}")
+                    failed.append(name)
+                    continue
+                write_json(os.path.join(args.out, name + '.json'), frames)
+                manifest["figures"][name] = {"video_sha256": digest, "frames": len(frames)}
+                # Saved after every figure so an interrupted build resumes where it stopped
+                write_json(args.manifest, manifest)
+                print(f"✅ {name}: {len(frames)} poses from {stats['frames_decoded']} frames")
+
+    store = ReferenceStore(args.out, LANDMARK_IDS).load_all()
+    figures = [store.get(name) for name in store.names()]
+    write_pack(args.pack, figures, LANDMARK_IDS)
+    print(f"📦 Packed {len(figures)} figures into {args.pack} in {time.perf_counter() - started:.1f}s")
+    if failed:
+        raise SystemExit(f"Failed to extract: {', '.join(sorted(failed))}")
+
+
+if __name__ == '__main__':
+    main()
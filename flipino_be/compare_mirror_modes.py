@@ -0,0 +1,63 @@
+"""Score the sample uploads with both mirror modes and show how far they drift.
+
+Usage: python compare_mirror_modes.py [--figure TiklosBoyFig1.json] [--videos uploads]
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+from scoring_service import process_video, reference_store
+
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+
+
+def run(video_path, reference, mirror_mode):
+    start = time.perf_counter()
+    accuracy, feedback = process_video(video_path, reference, mirror_mode=mirror_mode)
+    return {
+        "accuracy": round(accuracy, 2),
+        "seconds": round(time.perf_counter() - start, 3),
+        "worst_landmarks": [name for name, _ in feedback.get("worst_landmarks", [])],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--figure', default='TiklosBoyFig1.json', help="reference figure to score against")
+    parser.add_argument('--videos', default=UPLOAD_FOLDER, help="folder of .mp4 recordings")
+    parser.add_argument('--json', help="also write the rows to this file")
+    args = parser.parse_args()
+
+    reference = reference_store.get(args.figure)
+    if reference is None:
+        raise SystemExit(f"Unknown figure: {args.figure}")
+
+    rows = []
+    for video_path in sorted(glob.glob(os.path.join(args.videos, '*.mp4'))):
+        inference = run(video_path, reference, 'inference')
+        landmarks = run(video_path, reference, 'landmarks')
+        rows.append({
+            "video": os.path.basename(video_path),
+            "inference": inference,
+            "landmarks": landmarks,
+            "score_diff": round(landmarks["accuracy"] - inference["accuracy"], 2),
+        })
+
+    print(f"\n{'video':<48} {'inference':>10} {'landmarks':>10} {'diff':>7} {'speedup':>8}")
+    for row in rows:
+        speedup = row["inference"]["seconds"] / max(row["landmarks"]["seconds"], 1e-9)
+        print(f"{row['video']:<48} {row['inference']['accuracy']:>10.2f} {row['landmarks']['accuracy']:>10.2f} "
+              f"{row['score_diff']:>7.2f} {speedup:>7.2f}x")
+    if rows:
+        mean_abs = sum(abs(row["score_diff"]) for row in rows) / len(rows)
+        print(f"\nMean absolute score difference over {len(rows)} videos: {mean_abs:.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
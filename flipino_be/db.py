@@ -0,0 +1,194 @@
+import contextlib
+import os
+import queue
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the checkout timeout."""
+
+
+class ConnectionPool:
+    """A bounded pool of PostgreSQL connections shared by a worker process's threads.
+
+    min_size connections are opened by warm_up(); more are opened on demand up
+    to max_size, after which checkouts wait. A connection that sat idle for
+    longer than check_after seconds is pinged before it's handed out, and one
+    that is closed or fails the ping is replaced. Connections always go back
+    to the pool rolled back, whether or not the caller raised.
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, timeout=30.0, check_after=30.0, connect=None):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.check_after = check_after
+        self.connect = connect or psycopg2.connect
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._live = 0
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._replaced = 0
+
+    def _create(self):
+        conn = self.connect(self.dsn)
+        with self._lock:
+            self._created += 1
+        return conn
+
+    def warm_up(self):
+        """Open min_size connections now so the first requests skip connection setup."""
+        while True:
+            with self._lock:
+                if self._live >= self.min_size:
+                    break
+                self._live += 1
+            try:
+                conn = self._create()
+            except Exception:
+                with self._lock:
+                    self._live -= 1
+                raise
+            self._idle.put((conn, time.monotonic()))
+        print(f"✅ Database pool ready: {self.min_size}-{self.max_size} connections")
+        return self
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """Check out a connection; it's rolled back and returned when the block exits."""
+        conn = self._checkout(self.timeout if timeout is None else timeout)
+        try:
+            yield conn
+        finally:
+            self._checkin(conn)
+
+    def _after_fork(self):
+        # Sockets inherited from the parent process must not be used (or closed) here
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._idle = queue.LifoQueue()
+            self._live = self._in_use = self._waiting = 0
+
+    def _checkout(self, timeout):
+        self._after_fork()
+        while True:
+            grow = False
+            with self._lock:
+                try:
+                    conn, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = None
+                    grow = self._live < self.max_size
+                    if grow:
+                        self._live += 1
+                if conn is not None or grow:
+                    self._in_use += 1
+                else:
+                    self._waits += 1
+                    self._waiting += 1
+
+            if grow:
+                try:
+                    return self._create()
+                except Exception:
+                    with self._lock:
+                        self._live -= 1
+                        self._in_use -= 1
+                    raise
+
+            if conn is None:
+                start = time.monotonic()
+                try:
+                    conn, idle_since = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise PoolTimeout(f"No database connection free after {timeout}s")
+                finally:
+                    with self._lock:
+                        self._waiting -= 1
+                        self._wait_seconds += time.monotonic() - start
+                with self._lock:
+                    self._in_use += 1
+
+            if self._healthy(conn, idle_since):
+                return conn
+            # Dead connection: drop it and go round again, which opens a fresh one
+            self._discard(conn)
+            with self._lock:
+                self._in_use -= 1
+                self._replaced += 1
+
+    def _healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_after:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception as e:
+            print(f"⚠️ Dropping broken database connection: {e}")
+            return False
+
+    def _checkin(self, conn):
+        healthy = not conn.closed
+        if healthy and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                healthy = False
+        if not healthy:
+            self._discard(conn)
+            with self._lock:
+                self._in_use -= 1
+            return
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put((conn, time.monotonic()))
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._live -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "live": self._live,
+                "created": self._created,
+                "idle": self._idle.qsize(),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "waits": self._waits,
+                "wait_seconds": round(self._wait_seconds, 3),
+                "replaced": self._replaced,
+            }
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
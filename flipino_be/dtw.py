@@ -0,0 +1,159 @@
+import math
+
+import numpy as np
+
+
+def pairwise_distances(queries, reference):
+    """Euclidean distances between every query frame and every reference frame.
+
+    queries is (B, N, D), reference is (M, D); returns (B, N, M).
+    """
+    diff = queries[:, :, None, :] - reference[None, None, :, :]
+    return np.sqrt(np.einsum('bnmd,bnmd->bnm', diff, diff))
+
+
+def band_mask(n, m, band):
+    """Sakoe-Chiba band around the diagonal from (0, 0) to (n-1, m-1).
+
+    band is the half width in frames of the longer sequence. It is widened when
+    needed so a path can always get from corner to corner.
+    """
+    if band is None or n < 2 or m < 2:
+        return np.ones((n, m), dtype=bool)
+    longest, shortest = max(n, m), min(n, m)
+    band = max(band, math.ceil((longest - 1) / (shortest - 1)))
+    i = np.arange(n)[:, None] * (longest - 1) / (n - 1)
+    j = np.arange(m)[None, :] * (longest - 1) / (m - 1)
+    return np.abs(i - j) <= band
+
+
+def dtw_batch(queries, reference, band=None, max_cost=None, remaining=None):
+    """Exact DTW of several query sequences against one reference in one pass.
+
+    queries is a list of (N_b, D) arrays, reference an (M, D) array. Returns a
+    list of (cost, path) with path as [(query_idx, ref_idx), ...] from start to
+    end, or (inf, []) for an empty query. With max_cost, the alignment stops
+    early and returns (inf, []) for every query once none can finish under it;
+    remaining[b][i], if given, is a lower bound on what query b's frames from i
+    on still cost, which lets it stop sooner.
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    lengths = [len(q) for q in queries]
+    m = len(reference)
+    n = max(lengths, default=0)
+    if n == 0 or m == 0:
+        return [(math.inf, []) for _ in queries]
+
+    # Pad queries to a common length; cells past a query's end never feed back into its last cell
+    padded = np.zeros((len(queries), n, reference.shape[1]))
+    for b, q in enumerate(queries):
+        padded[b, :len(q)] = q
+    cost = pairwise_distances(padded, reference)
+    for b, length in enumerate(lengths):
+        if length:
+            cost[b, :length][~band_mask(length, m, band)] = np.inf
+
+    # Accumulate along anti-diagonals: every cell on one depends only on the previous two
+    acc = np.full((len(queries), n + 1, m + 1), np.inf)
+    acc[:, 0, 0] = 0.0
+    to_go = np.zeros((len(queries), n + 1))
+    if remaining is not None:
+        for b, bound in enumerate(remaining):
+            to_go[b, :len(bound)] = bound
+    previous = 0.0
+    for k in range(2, n + m + 1):
+        i = np.arange(max(1, k - m), min(n, k - 1) + 1)
+        j = k - i
+        best = np.minimum(np.minimum(acc[:, i - 1, j - 1], acc[:, i - 1, j]), acc[:, i, j - 1])
+        acc[:, i, j] = cost[:, i - 1, j - 1] + best
+        # Every path crosses anti-diagonal k or k - 1, and costs only grow from there
+        if max_cost is not None:
+            reachable = (acc[:, i, j] + to_go[:, i]).min()
+            if min(reachable, previous) >= max_cost:
+                return [(math.inf, []) for _ in queries]
+            previous = reachable
+
+    return [(float(acc[b, length, m]), warping_path(acc[b], length, m)) if length else (math.inf, [])
+            for b, length in enumerate(lengths)]
+
+
+def dtw(query, reference, band=None):
+    """Exact DTW of one query against a reference, returns (cost, path)."""
+    return dtw_batch([np.asarray(query, dtype=np.float64)], reference, band)[0]
+
+
+class OnlineDTW:
+    """Unconstrained DTW of a query that grows one frame at a time against a fixed reference.
+
+    Keeps every accumulated cost row, so after n frames result() equals
+    dtw(query, reference) without redoing the alignment, and best_end() gives
+    the open-end alignment: the reference frame the query so far is best
+    matched to, by mean cost along the path.
+    """
+
+    def __init__(self, reference):
+        self.reference = np.asarray(reference, dtype=np.float64)
+        m = len(self.reference)
+        self.rows = [np.concatenate([[0.0], np.full(m, np.inf)])]
+        self._steps = [0] * (m + 1)  # path length to each cell of the last row
+
+    def __len__(self):
+        return len(self.rows) - 1
+
+    def append(self, frame):
+        diff = self.reference - np.asarray(frame, dtype=np.float64)[None, :]
+        cost = np.sqrt(np.einsum('md,md->m', diff, diff)).tolist()
+        prev, prev_steps = self.rows[-1].tolist(), self._steps
+        row, steps = [math.inf] * len(prev), [0] * len(prev)
+        # A cell's left neighbour is in the same row, so this is a scan rather than one array operation
+        for j in range(1, len(prev)):
+            best, length = prev[j - 1], prev_steps[j - 1]
+            if prev[j] < best:
+                best, length = prev[j], prev_steps[j]
+            if row[j - 1] < best:
+                best, length = row[j - 1], steps[j - 1]
+            row[j] = cost[j - 1] + best
+            steps[j] = length + 1
+        self.rows.append(np.array(row))
+        self._steps = steps
+
+    def best_end(self):
+        """(reference index, mean cost per step) of the best alignment of the query so far, or (None, inf)."""
+        if not len(self):
+            return None, math.inf
+        mean_cost = self.rows[-1][1:] / np.maximum(self._steps[1:], 1)
+        j = int(np.argmin(mean_cost))
+        return j, float(mean_cost[j])
+
+    def result(self):
+        """(cost, path) of the whole query against the whole reference, like dtw()."""
+        n, m = len(self), len(self.reference)
+        if n == 0 or m == 0:
+            return math.inf, []
+        acc = np.vstack(self.rows)
+        acc[1:, 0] = np.inf
+        return float(acc[n, m]), warping_path(acc, n, m)
+
+
+def warping_path(acc, i, j):
+    """Backtrack the cheapest path ending at cell (i, j) of an accumulated cost matrix."""
+    path = []
+    while i > 0 and j > 0:
+        path.append((i - 1, j - 1))
+        steps = (acc[i - 1, j - 1], acc[i - 1, j], acc[i, j - 1])
+        step = int(np.argmin(steps))
+        if step == 0:
+            i, j = i - 1, j - 1
+        elif step == 1:
+            i -= 1
+        else:
+            j -= 1
+    path.reverse()
+    return path
+
+
+def dtw_similarity(cost, path):
+    """Map a DTW cost to 0-100: one minus the mean matched-frame distance."""
+    if not path:
+        return 0.0
+    return max(0, 1 - (cost / len(path))) * 100
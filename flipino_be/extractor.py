@@ -0,0 +1,359 @@
+import collections
+import math
+import queue
+import threading
+import time
+
+import cv2
+
+from scoring import LANDMARK_IDS, MIRROR_IDS
+
+
+def extract_pose_landmarks(landmarks, mirror=False):
+    """Pick LANDMARK_IDS out of a MediaPipe result; mirror=True returns the pose
+    MediaPipe would see in the horizontally flipped frame."""
+    if not landmarks or not landmarks.landmark:
+        return []
+
+    pose = []
+    visible_count = 0
+    for i in LANDMARK_IDS:
+        lm = landmarks.landmark[MIRROR_IDS[i] if mirror else i]
+        if lm.visibility > 0.5:
+            x, y, z = (1.0 - lm.x) if mirror else lm.x, lm.y, lm.z or 0.0
+            visible_count += 1
+        else:
+            x, y, z = 0.0, 0.0, 0.0
+        pose.append((x, y, z))
+    # Only return pose if enough landmarks are visible
+    if visible_count < len(LANDMARK_IDS) // 2:
+        return []
+    return pose
+
+
+Landmark = collections.namedtuple('Landmark', 'x y z visibility')
+
+
+class MappedLandmarks:
+    """Stands in for a MediaPipe landmark list once landmarks are moved back to full-frame coordinates."""
+
+    def __init__(self, landmark):
+        self.landmark = landmark
+
+
+class InferenceInput:
+    """Shrinks what the estimator sees: a capped resolution and, optionally, a crop around the dancer.
+
+    Frames whose longer side is over max_dim (0 for no cap) are downscaled
+    before colour conversion, which leaves normalized landmarks where they
+    were. With roi_margin, frames are cropped to the last pose's bounding box
+    grown by that fraction of its size on each side. The crop is kept while
+    the pose stays inside it, so the estimator's own tracking sees a steady
+    view, and a frame with no pose in the crop is rerun on the full frame.
+    Landmarks always come back in full-frame normalized coordinates.
+    Holds per-video state: use one per video and estimator.
+    """
+
+    def __init__(self, max_dim=0, roi_margin=0.0):
+        self.max_dim = max_dim
+        self.roi_margin = roi_margin
+        self.roi = None  # (x0, y0, x1, y1) normalized, or None for the full frame
+        self.full_frame_retries = 0
+
+    def process(self, pose, frame, mirror_mode):
+        """(pose, flipped pose) for one BGR frame, like process_frame."""
+        region = self._region(frame) if self.roi is not None else None
+        landmarks = self._infer(pose, frame, region, flip=False)
+        if landmarks is None and region is not None:
+            # Lost the dancer in the crop: look at the whole frame again
+            self.full_frame_retries += 1
+            region = None
+            landmarks = self._infer(pose, frame, None, flip=False)
+        landmarks_flipped = self._infer(pose, frame, region, flip=True) if mirror_mode == 'inference' else landmarks
+        if self.roi_margin:
+            self._track(landmarks)
+
+        extracted = extract_pose_landmarks(landmarks) if landmarks else []
+        extracted_flipped = []
+        if landmarks_flipped:
+            extracted_flipped = extract_pose_landmarks(landmarks_flipped, mirror=mirror_mode != 'inference')
+        return extracted, extracted_flipped
+
+    def _region(self, frame):
+        height, width = frame.shape[:2]
+        x0, y0, x1, y1 = self.roi
+        return (int(math.floor(x0 * width)), int(math.floor(y0 * height)),
+                int(math.ceil(x1 * width)), int(math.ceil(y1 * height)))
+
+    def _infer(self, pose, frame, region, flip):
+        height, width = frame.shape[:2]
+        image = frame
+        if region is not None:
+            x0, y0, x1, y1 = region
+            image = frame[y0:y1, x0:x1]
+        crop_height, crop_width = image.shape[:2]
+        if self.max_dim and max(crop_height, crop_width) > self.max_dim:
+            scale = self.max_dim / max(crop_height, crop_width)
+            image = cv2.resize(image, (max(int(round(crop_width * scale)), 1), max(int(round(crop_height * scale)), 1)),
+                               interpolation=cv2.INTER_LINEAR)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        if flip:
+            image = cv2.flip(image, 1)
+        results = pose.process(image)
+        if not results.pose_landmarks:
+            return None
+        if region is None:
+            return results.pose_landmarks
+        # Crop-normalized to full-frame normalized; in the flipped frame the crop sits mirrored
+        left = width - x1 if flip else x0
+        return MappedLandmarks([
+            Landmark((lm.x * crop_width + left) / width, (lm.y * crop_height + y0) / height,
+                     (lm.z or 0.0) * crop_width / width, lm.visibility)
+            for lm in results.pose_landmarks.landmark])
+
+    def _track(self, landmarks):
+        visible = [lm for lm in landmarks.landmark if lm.visibility > 0.5] if landmarks else []
+        if not visible:
+            self.roi = None
+            return
+        xs, ys = [lm.x for lm in visible], [lm.y for lm in visible]
+        pad_x = (max(xs) - min(xs)) * self.roi_margin
+        pad_y = (max(ys) - min(ys)) * self.roi_margin
+        needed = (max(min(xs) - pad_x, 0.0), max(min(ys) - pad_y, 0.0),
+                  min(max(xs) + pad_x, 1.0), min(max(ys) + pad_y, 1.0))
+        if needed[2] <= needed[0] or needed[3] <= needed[1]:
+            self.roi = None
+            return
+        roi = self.roi
+        inside = roi is not None and roi[0] <= needed[0] and roi[1] <= needed[1] \
+            and roi[2] >= needed[2] and roi[3] >= needed[3]
+        area = lambda box: (box[2] - box[0]) * (box[3] - box[1])
+        # Move the crop only when the dancer leaves it or it has become much bigger than needed
+        if not inside or area(roi) > 2 * area(needed):
+            self.roi = needed
+
+
+def process_frame(pose, frame, mirror_mode, inference_input=None):
+    """Run inference on one BGR frame, returns (pose, flipped pose); [] where nothing valid was found.
+
+    inference_input, an InferenceInput, caps the resolution and crops the frame first.
+    """
+    if inference_input is not None:
+        return inference_input.process(pose, frame, mirror_mode)
+    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    # Process original
+    results = pose.process(frame_rgb)
+    extracted = extract_pose_landmarks(results.pose_landmarks) if results.pose_landmarks else []
+    # Process flipped
+    if mirror_mode == 'inference':
+        frame_rgb_flipped = cv2.flip(frame_rgb, 1)
+        results_flipped = pose.process(frame_rgb_flipped)
+    else:
+        results_flipped = results
+    extracted_flipped = []
+    if results_flipped.pose_landmarks:
+        extracted_flipped = extract_pose_landmarks(results_flipped.pose_landmarks,
+                                                   mirror=mirror_mode != 'inference')
+    return extracted, extracted_flipped
+
+
+class ExtractionStats:
+    """Frame counts and busy time per pipeline stage."""
+
+    def __init__(self):
+        self.frames_decoded = 0
+        self.frames_sampled = 0
+        self.decode_seconds = 0.0
+        self.inference_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.stopped_early = None  # why extraction stopped before the end of the video, if it did
+        self._lock = threading.Lock()
+
+    def add_inference(self, seconds):
+        with self._lock:
+            self.inference_seconds += seconds
+
+    def as_dict(self):
+        return {
+            "frames_decoded": self.frames_decoded,
+            "frames_sampled": self.frames_sampled,
+            "decode_fps": round(self.frames_decoded / self.decode_seconds, 1) if self.decode_seconds else 0.0,
+            "inference_fps": round(self.frames_sampled / self.inference_seconds, 1) if self.inference_seconds else 0.0,
+            "decode_seconds": round(self.decode_seconds, 3),
+            "inference_seconds": round(self.inference_seconds, 3),
+            "wall_seconds": round(self.wall_seconds, 3),
+            "stopped_early": self.stopped_early,
+        }
+
+
+def video_fps(cap):
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    # Some containers report 0 or nonsense; phones record at 24-60 fps
+    return fps if 1 <= fps <= 240 else 30.0
+
+
+def max_sampled_frames(cap, poses_per_second):
+    """Upper bound on the frames sampled_frames will yield for a video, or None if its length is unknown."""
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    if not frame_count or frame_count <= 0:
+        return None
+    # At most one sample per interval, plus a second of slack for variable frame rate videos
+    duration = frame_count / video_fps(cap)
+    return int(duration * poses_per_second) + 1 + int(poses_per_second)
+
+
+class NoBodyGate:
+    """Decides while poses are being extracted that the video will be rejected for no body.
+
+    Extraction can stop once fewer than min_poses valid poses are possible in
+    both orientations, even if every frame left had one (bounded by the
+    container's frame count), or once the first `budget` sampled frames have
+    all come up empty (0 turns that off). Thread-safe; add() returns True
+    when extraction should stop.
+    """
+
+    def __init__(self, cap, poses_per_second, min_poses, budget=0):
+        self.max_frames = max_sampled_frames(cap, poses_per_second)
+        self.min_poses = min_poses
+        self.budget = budget
+        self.frames = 0
+        self.poses = 0
+        self.poses_flipped = 0
+        self.reason = None
+        self._lock = threading.Lock()
+
+    def add(self, extracted, extracted_flipped):
+        with self._lock:
+            self.frames += 1
+            self.poses += bool(extracted)
+            self.poses_flipped += bool(extracted_flipped)
+            if self.reason is None:
+                if self.budget and self.frames >= self.budget and not (self.poses or self.poses_flipped):
+                    self.reason = 'no_detections'
+                elif self.max_frames is not None:
+                    left = max(self.max_frames - self.frames, 0)
+                    if max(self.poses, self.poses_flipped) + left < self.min_poses:
+                        self.reason = 'too_few_poses'
+            return self.reason is not None
+
+
+def sampled_frames(cap, poses_per_second, stats):
+    """Yield (timestamp_seconds, frame) at about poses_per_second, whatever the video's frame rate.
+
+    Every frame is grab()bed to read its timestamp, but only sampled frames are retrieved.
+    """
+    fps = video_fps(cap)
+    interval = 1.0 / poses_per_second
+    next_sample = 0.0
+    frame_idx = 0
+    while cap.isOpened():
+        start = time.perf_counter()
+        ret = cap.grab()
+        frame = None
+        if ret:
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if timestamp <= 0 and frame_idx > 0:
+                timestamp = frame_idx / fps
+            # Half a frame of slack so a 30 fps video sampled at 6/s takes exactly every 5th frame
+            if timestamp + 0.5 / fps >= next_sample:
+                ret, frame = cap.retrieve()
+                while next_sample <= timestamp + 0.5 / fps:
+                    next_sample += interval
+        stats.decode_seconds += time.perf_counter() - start
+        if not ret:
+            break
+        stats.frames_decoded += 1
+        frame_idx += 1
+        if frame is not None:
+            stats.frames_sampled += 1
+            yield timestamp, frame
+
+
+def extract_pose_tracks(cap, pose_pool, mirror_mode='landmarks', poses_per_second=6.0, workers=1, queue_size=8,
+                        gate=None, max_dim=0, roi_margin=0.0):
+    """Decode on a background thread while inference workers consume a bounded frame queue.
+
+    Returns (user_poses, user_times, user_poses_flipped, user_times_flipped, stats)
+    with a timestamp in seconds for every pose. Results are put back in
+    frame order, so with one worker the tracks match a plain serial loop
+    exactly. More workers each hold their own estimator (and tracking state),
+    which trades that exactness for throughput on long videos. max_dim and
+    roi_margin set up each worker's InferenceInput (0 for both leaves frames
+    as they are). With a gate (see NoBodyGate) decoding stops as soon as it
+    reports certain rejection, and stats.stopped_early says why.
+    """
+    stats = ExtractionStats()
+    frames = queue.Queue(maxsize=queue_size)
+    results = {}
+    errors = []
+    stop = threading.Event()
+    started = time.perf_counter()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def decode():
+        try:
+            for seq, (timestamp, frame) in enumerate(sampled_frames(cap, poses_per_second, stats)):
+                if stop.is_set():
+                    break
+                put((seq, timestamp, frame))
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            for _ in range(workers):
+                put(None)
+
+    def infer():
+        try:
+            inference_input = InferenceInput(max_dim, roi_margin) if max_dim or roi_margin else None
+            with pose_pool.acquire() as pose:
+                while not stop.is_set():
+                    try:
+                        item = frames.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if item is None:
+                        break
+                    seq, timestamp, frame = item
+                    start = time.perf_counter()
+                    results[seq] = (timestamp,) + process_frame(pose, frame, mirror_mode, inference_input)
+                    stats.add_inference(time.perf_counter() - start)
+                    if gate is not None and gate.add(*results[seq][1:]):
+                        stats.stopped_early = gate.reason
+                        stop.set()
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=decode, name='pose-decode', daemon=True)]
+    threads += [threading.Thread(target=infer, name=f'pose-infer-{i}', daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.wall_seconds = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+
+    return collect_tracks(results[seq] for seq in sorted(results)) + (stats,)
+
+
+def collect_tracks(frame_results):
+    """Split (timestamp, pose, flipped pose) results into the two tracks, dropping invalid poses."""
+    user_poses, user_times, user_poses_flipped, user_times_flipped = [], [], [], []
+    for timestamp, extracted, extracted_flipped in frame_results:
+        if extracted:  # Only add if valid
+            user_poses.append(extracted)
+            user_times.append(timestamp)
+        if extracted_flipped:
+            user_poses_flipped.append(extracted_flipped)
+            user_times_flipped.append(timestamp)
+    return user_poses, user_times, user_poses_flipped, user_times_flipped
+
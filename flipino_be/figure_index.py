@@ -0,0 +1,164 @@
+"""Find which reference figures a performance matches without running DTW against all of them.
+
+Every warping path visits every query frame at least once, and inside a
+Sakoe-Chiba band query frame i can only be matched to reference frames in a
+window W(i). So the distance from frame i to the bounding box (the LB_Keogh
+envelope) of the reference over W(i) can't exceed what the path pays for it,
+and summing those distances bounds the DTW cost from below. The same holds
+with the roles swapped; the larger of the two is used.
+
+Figures are ranked by DTW cost over n + m - 1, the longest possible path,
+so figures of different lengths compare fairly and each cost bound is a bound
+on the ranking distance too. Each match's score is 100 / (1 + distance):
+100 for a perfect match and falling with the distance, so unlike
+dtw_similarity, which clips at 0, poor matches still rank. Candidates are checked best bound first
+with exact DTW, stopping as soon as no remaining bound can beat the k-th best
+exact distance; an alignment that can no longer beat it is abandoned midway. Results are identical to running exact DTW against every
+figure in both orientations.
+"""
+import math
+import threading
+
+import numpy as np
+
+from dtw import dtw_batch
+
+
+class SparseTable:
+    """Per-dimension min/max over any contiguous frame range in O(1), after O(m log m) setup."""
+
+    def __init__(self, frames):
+        self.mins = [frames]
+        self.maxs = [frames]
+        width = 1
+        while width * 2 <= len(frames):
+            lo, hi = self.mins[-1], self.maxs[-1]
+            self.mins.append(np.minimum(lo[:-width], lo[width:]))
+            self.maxs.append(np.maximum(hi[:-width], hi[width:]))
+            width *= 2
+
+    def envelope(self, start, stop):
+        """Lower and upper envelopes over frames start[i]..stop[i] (inclusive), for every i."""
+        level = np.floor(np.log2(stop - start + 1)).astype(int)
+        lower = np.empty((len(start), self.mins[0].shape[1]))
+        upper = np.empty_like(lower)
+        for k in np.unique(level):
+            rows = level == k
+            a, b = start[rows], stop[rows] - (1 << k) + 1
+            lower[rows] = np.minimum(self.mins[k][a], self.mins[k][b])
+            upper[rows] = np.maximum(self.maxs[k][a], self.maxs[k][b])
+        return lower, upper
+
+
+def band_windows(n, m, band):
+    """For each of n query frames, the first and last of m reference frames band_mask allows.
+
+    Rounded outwards, so the windows always contain band_mask's cells.
+    """
+    if band is None or n < 2 or m < 2:
+        return np.zeros(n, dtype=int), np.full(n, m - 1)
+    longest, shortest = max(n, m), min(n, m)
+    band = max(band, math.ceil((longest - 1) / (shortest - 1)))
+    centre = np.arange(n) * (longest - 1) / (n - 1)
+    scale = (m - 1) / (longest - 1)
+    start = np.ceil((centre - band) * scale - 1e-9).astype(int)
+    stop = np.floor((centre + band) * scale + 1e-9).astype(int)
+    return np.clip(start, 0, m - 1), np.clip(stop, 0, m - 1)
+
+
+def envelope_gaps(query, table, m, band):
+    """Distance from each query frame to the reference envelope of its band window."""
+    start, stop = band_windows(len(query), m, band)
+    lower, upper = table.envelope(start, stop)
+    gap = np.maximum(lower - query, 0.0) + np.maximum(query - upper, 0.0)
+    return np.sqrt(np.einsum('nd,nd->n', gap, gap))
+
+
+def ranking_distance(cost, n, m):
+    return cost / (n + m - 1)
+
+
+def match_score(distance):
+    """0-100 for a ranking distance, higher for closer matches."""
+    return 100.0 / (1.0 + distance)
+
+
+class FigureIndex:
+    """Envelope index over a reference store's figures, rebuilt per figure when the store reloads it."""
+
+    def __init__(self, reference_store, band=None):
+        self.reference_store = reference_store
+        self.band = band
+        self._entries = {}  # name -> (figure, frames (m, D), SparseTable)
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        with self._lock:
+            names = self.reference_store.names()
+            for name in set(self._entries) - set(names):
+                del self._entries[name]
+            for name in names:
+                figure = self.reference_store.get(name)
+                if figure is None or len(figure) == 0:
+                    self._entries.pop(name, None)
+                    continue
+                entry = self._entries.get(name)
+                if entry is None or entry[0] is not figure:
+                    frames = np.asarray(figure.normalized, dtype=np.float64).reshape(len(figure), -1)
+                    self._entries[name] = (figure, frames, SparseTable(frames))
+            return dict(self._entries)
+
+    def search(self, queries, top_k=3, prune=True):
+        """Best figures for the query tracks (e.g. {'normal': (n, 13, 3), 'flipped': ...} normalized poses).
+
+        Returns (matches, stats): matches are dicts with figure, score (see
+        match_score), distance (DTW cost over n + m - 1, lower is better) and orientation, best first, one per figure; stats counts the exact DTW
+        runs, those abandoned early and the candidates the bounds skipped.
+        """
+        entries = self._refresh()
+        queries = {orientation: np.asarray(q, dtype=np.float64).reshape(len(q), -1)
+                   for orientation, q in queries.items() if len(q)}
+        query_tables = {orientation: SparseTable(q) for orientation, q in queries.items()}
+
+        candidates = []
+        for name, (figure, frames, table) in entries.items():
+            m = len(frames)
+            for orientation, query in queries.items():
+                n = len(query)
+                bound, to_go = 0.0, None
+                if prune:
+                    # Cost still to come from query frame i on, for abandoning the exact DTW
+                    to_go = np.cumsum(envelope_gaps(query, table, m, self.band)[::-1])[::-1]
+                    bound = max(float(to_go[0]),
+                                float(envelope_gaps(frames, query_tables[orientation], n, self.band).sum()))
+                candidates.append((ranking_distance(bound, n, m), name, orientation, to_go))
+        candidates.sort(key=lambda c: c[0])
+
+        best = {}  # figure -> (distance, orientation)
+        exact_runs = abandoned = 0
+        for lower, name, orientation, to_go in candidates:
+            ranked = sorted(distance for distance, _ in best.values())
+            if prune and len(ranked) >= top_k and lower >= ranked[top_k - 1]:
+                break
+            if name in best and lower >= best[name][0]:
+                continue
+            n, m = len(queries[orientation]), len(entries[name][1])
+            max_cost = None
+            if prune and len(ranked) >= top_k:
+                max_cost = ranked[top_k - 1] * (n + m - 1)
+            cost, path = dtw_batch([queries[orientation]], entries[name][1], band=self.band,
+                                   max_cost=max_cost, remaining=[to_go] if to_go is not None else None)[0]
+            exact_runs += 1
+            if not path:
+                abandoned += 1
+                continue
+            distance = ranking_distance(cost, n, m)
+            if name not in best or distance < best[name][0]:
+                best[name] = (distance, orientation)
+
+        ranked = sorted(best.items(), key=lambda item: (item[1][0], item[0]))[:top_k]
+        matches = [{"figure": name, "score": round(match_score(distance), 2), "distance": round(distance, 4),
+                    "orientation": orientation}
+                   for name, (distance, orientation) in ranked]
+        return matches, {"candidates": len(candidates), "exact_dtw": exact_runs, "abandoned": abandoned,
+                         "pruned": len(candidates) - exact_runs}
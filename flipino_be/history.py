@@ -0,0 +1,70 @@
+"""user_history reads for /user_history, paginated by keyset.
+
+Rows are ordered newest first by (attempted_at, id); a page's cursor is the
+position of its last row, so the next page starts strictly after it. Every
+filter combination is served by one of the idx_user_history_* indexes in
+`table`, with no sort and no OFFSET scan however deep the page.
+"""
+import base64
+import binascii
+import datetime
+import json
+import uuid
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(attempted_at, row_id):
+    raw = json.dumps([attempted_at.isoformat(), str(row_id)]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (attempted_at, id) from a cursor; raises ValueError if it wasn't one of ours."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        attempted_at, row_id = json.loads(raw)
+        return datetime.datetime.fromisoformat(attempted_at), str(uuid.UUID(row_id))
+    except (binascii.Error, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def fetch_history(conn, user_id, dance_name=None, figure_name=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of a user's attempts, newest first; returns (rows, next_cursor or None)."""
+    conditions = ["user_id = %s"]
+    params = [user_id]
+    if dance_name:
+        conditions.append("dance_name = %s")
+        params.append(dance_name)
+    if figure_name:
+        conditions.append("figure_name = %s")
+        params.append(figure_name)
+    if cursor:
+        conditions.append("(attempted_at, id) < (%s, %s)")
+        params.extend(decode_cursor(cursor))
+    params.append(limit + 1)  # one extra row tells us whether there's another page
+
+    db_cursor = conn.cursor()
+    db_cursor.execute(f"""
+        SELECT id, dance_name, figure_name, score, attempted_at
+        FROM user_history
+        WHERE {' AND '.join(conditions)}
+        ORDER BY attempted_at DESC, id DESC
+        LIMIT %s
+    """, params)
+    rows = db_cursor.fetchall()
+    db_cursor.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][4], rows[-1][0])
+    return [
+        {
+            'dance_name': row[1],
+            'figure_name': row[2],
+            'score': row[3],
+            'attempted_at': row[4].isoformat()
+        } for row in rows
+    ], next_cursor
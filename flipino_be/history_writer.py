@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+import uuid
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from progress import update_progress
+
+
+def write_history(cursor, rows, counts):
+    """Insert user_history rows, roll them into progress and add play counts per dance, in the caller's transaction.
+
+    rows are (user_id, dance_name, figure_name, score, attempt id, scoring_version);
+    counts is {dance_name: plays}.
+    """
+    if rows:
+        execute_values(cursor, """
+            INSERT INTO user_history (user_id, dance_name, figure_name, score, id, scoring_version) VALUES %s
+        """, rows)
+        update_progress(cursor, rows)
+    if counts:
+        # Sorted so concurrent writers from other workers lock the rows in the same order
+        execute_values(cursor, """
+            INSERT INTO simulated_dance_stats (dance_name, performed_count) VALUES %s
+            ON CONFLICT (dance_name)
+            DO UPDATE SET performed_count = simulated_dance_stats.performed_count + EXCLUDED.performed_count
+        """, sorted(counts.items()))
+
+
+def is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+class HistoryWriter:
+    """Write-behind buffer for user_history rows and simulated_dance_stats counters.
+
+    record() only appends to memory, so uploads don't wait on the database.
+    A background thread flushes every `interval` seconds (sooner once
+    max_rows rows are waiting): all history rows go out in one multi-row
+    INSERT and the play counts are merged into one upsert row per dance, in
+    the same transaction. If a flush fails everything is kept for the next
+    one; when the buffer is full record() waits up to put_timeout seconds
+    for room and then drops the row. Rows the database rejects (bad values,
+    foreign key violations) are written one by one instead and only those
+    are dropped, so one bad row can't hold back everyone else's.
+    """
+
+    def __init__(self, connection, interval=1.0, max_rows=1000, put_timeout=5.0, on_flush=None):
+        self.connection = connection  # callable returning a connection context manager
+        self.on_flush = on_flush  # called with the written history rows after each successful flush
+        self.interval = interval
+        self.max_rows = max_rows
+        self.put_timeout = put_timeout
+        self._cond = threading.Condition()
+        self._rows = []
+        self._counts = {}
+        self._recorded = 0  # sequence number of the last record()
+        self._flushed = 0   # sequence number covered by the last successful flush
+        self._dropped = 0
+        self._failures = 0
+        self._wake = False
+        self._stopping = False
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        # Started lazily (and again after a fork) so each worker process runs its own flusher
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+
+    def record(self, user_id, dance_name, figure_name, score, attempt_id=None, scoring_version=None):
+        """Queue an attempt: always counts towards the dance's plays, saved to history when user_id is set.
+
+        attempt_id becomes the user_history id (a new one if not given), so
+        anything saved for the attempt beforehand can be found by it.
+        """
+        with self._cond:
+            self._ensure_thread()
+            if user_id and not is_uuid(user_id):
+                self._dropped += 1
+                print(f"❌ Not a user id, dropped attempt for {user_id!r} - {figure_name}")
+            elif user_id and figure_name:
+                deadline = time.monotonic() + self.put_timeout
+                while len(self._rows) >= self.max_rows and not self._stopping:
+                    self._wake = True
+                    self._cond.notify_all()
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._dropped += 1
+                        print(f"❌ History buffer full, dropped attempt for {user_id} - {figure_name}")
+                        return
+                    self._cond.wait(remaining)
+                self._rows.append((user_id, dance_name, figure_name, score, attempt_id or str(uuid.uuid4()),
+                                   scoring_version))
+                if len(self._rows) >= self.max_rows:
+                    self._wake = True
+                    self._cond.notify_all()
+            self._counts[dance_name] = self._counts.get(dance_name, 0) + 1
+            self._recorded += 1
+
+    def has_pending(self, user_id):
+        """True if this process still holds unwritten attempts for user_id."""
+        with self._cond:
+            return any(row[0] == user_id for row in self._rows)
+
+    def flush(self, timeout=None):
+        """Wait until everything recorded so far is written; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._recorded
+            if self._flushed >= target:
+                return True
+            self._ensure_thread()
+            while self._flushed < target:
+                self._wake = True
+                self._cond.notify_all()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def _run(self):
+        ok = True
+        while True:
+            with self._cond:
+                # Other notifies (room in the buffer, a flush done) don't cut the interval short, and after a
+                # failed flush it's waited out even if asked to hurry, so a down database isn't hammered
+                deadline = time.monotonic() + self.interval
+                while not self._stopping and not (self._wake and ok):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._wake = False
+                stopping = self._stopping
+            ok = self._flush_once()
+            if stopping:
+                return
+
+    def _flush_once(self):
+        with self._cond:
+            rows, counts, target = self._rows, self._counts, self._recorded
+            if target == self._flushed:
+                return True
+            self._rows, self._counts = [], {}
+            self._cond.notify_all()  # room in the buffer again
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    write_history(cursor, rows, counts)
+                except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                    print(f"⚠️ History batch rejected ({e}), saving its {len(rows)} attempts one by one")
+                    conn.rollback()
+                    rows = self._write_each(cursor, rows)
+                    write_history(cursor, [], counts)
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            print(f"❌ Error saving user history ({len(rows)} attempts), will retry: {e}")
+            with self._cond:
+                self._failures += 1
+                self._rows = rows + self._rows
+                if len(self._rows) > self.max_rows:
+                    overflow = len(self._rows) - self.max_rows
+                    self._dropped += overflow
+                    del self._rows[:overflow]
+                    print(f"❌ History buffer full, dropped {overflow} oldest attempts")
+                for dance_name, count in counts.items():
+                    self._counts[dance_name] = self._counts.get(dance_name, 0) + count
+            return False
+        with self._cond:
+            self._flushed = max(self._flushed, target)
+            self._cond.notify_all()
+        if rows:
+            print(f"✅ Saved {len(rows)} user history rows, {sum(counts.values())} dance plays")
+        if self.on_flush is not None and rows:
+            self.on_flush(rows)
+        return True
+
+    def _write_each(self, cursor, rows):
+        """Write rows in their own savepoints, dropping those the database rejects; returns the ones written."""
+        written = []
+        for row in rows:
+            cursor.execute("SAVEPOINT history_row")
+            try:
+                write_history(cursor, [row], {})
+            except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT history_row")
+                with self._cond:
+                    self._dropped += 1
+                print(f"❌ Dropped history row for {row[0]} - {row[2]}: {e}")
+                continue
+            cursor.execute("RELEASE SAVEPOINT history_row")
+            written.append(row)
+        return written
+
+    def stats(self):
+        with self._cond:
+            return {
+                "buffered_rows": len(self._rows),
+                "buffered_dances": len(self._counts),
+                "pending": self._recorded - self._flushed,
+                "dropped": self._dropped,
+                "failures": self._failures,
+            }
+
+    def close(self, timeout=10.0):
+        """Stop the flusher after one last flush (registered with atexit)."""
+        with self._cond:
+            if self._thread is None or self._pid != os.getpid():
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
@@ -0,0 +1,149 @@
+"""Postgres-backed scoring job queue (table scoring_jobs, see `table`).
+
+Workers claim jobs with FOR UPDATE SKIP LOCKED, so any number of worker
+processes on any number of nodes can drain the same queue without
+double-processing a job. Videos are stored in the row so workers don't
+need a shared filesystem.
+"""
+import json
+import uuid
+
+import psycopg2
+
+
+def is_job_id(job_id):
+    try:
+        uuid.UUID(str(job_id))
+        return True
+    except ValueError:
+        return False
+
+
+# Advisory lock key ("FLJQ") taken by enqueue_job so the depth check and the insert can't interleave
+ENQUEUE_LOCK = 0x464C4A51
+
+
+def enqueue_job(conn, figure_name, user_id, video_bytes, max_depth=None):
+    """Queue a video; returns the job id, or None if max_depth jobs are already queued.
+
+    The count and the insert run in one transaction under an advisory lock, so
+    concurrent uploads can't push the queue past max_depth.
+    """
+    cursor = conn.cursor()
+    if max_depth is not None:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (ENQUEUE_LOCK,))
+        cursor.execute("SELECT count(*) FROM scoring_jobs WHERE status = 'queued'")
+        if cursor.fetchone()[0] >= max_depth:
+            conn.rollback()
+            cursor.close()
+            return None
+    cursor.execute(
+        "INSERT INTO scoring_jobs (figure_name, user_id, video) VALUES (%s, %s, %s) RETURNING id",
+        (figure_name, user_id, psycopg2.Binary(video_bytes))
+    )
+    job_id = cursor.fetchone()[0]
+    conn.commit()
+    cursor.close()
+    return str(job_id)
+
+
+def queue_depth(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT count(*) FROM scoring_jobs WHERE status = 'queued'")
+    depth = cursor.fetchone()[0]
+    cursor.close()
+    return depth
+
+
+def claim_job(conn, worker_id):
+    """Atomically take the oldest queued job, or return None when the queue is empty."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE scoring_jobs
+        SET status = 'running', started_at = current_timestamp, attempts = attempts + 1, worker_id = %s
+        WHERE id = (
+            SELECT id FROM scoring_jobs
+            WHERE status = 'queued'
+            ORDER BY created_at
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, figure_name, user_id, video, attempts
+    """, (worker_id,))
+    row = cursor.fetchone()
+    conn.commit()
+    cursor.close()
+    if not row:
+        return None
+    return {
+        "id": str(row[0]),
+        "figure_name": row[1],
+        "user_id": row[2],
+        "video": bytes(row[3]) if row[3] is not None else b'',
+        "attempts": row[4],
+    }
+
+
+def complete_job(conn, job_id, result, http_status=200):
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE scoring_jobs
+        SET status = 'done', result = %s, http_status = %s, video = NULL, finished_at = current_timestamp
+        WHERE id = %s
+    """, (json.dumps(result), http_status, job_id))
+    conn.commit()
+    cursor.close()
+
+
+def fail_job(conn, job_id, error, max_attempts):
+    """Put a job back in the queue, or mark it failed once it used up its attempts."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE scoring_jobs
+        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+            error = %s,
+            video = CASE WHEN attempts >= %s THEN NULL ELSE video END,
+            finished_at = CASE WHEN attempts >= %s THEN current_timestamp ELSE NULL END
+        WHERE id = %s
+    """, (max_attempts, error, max_attempts, max_attempts, job_id))
+    conn.commit()
+    cursor.close()
+
+
+def requeue_stale_jobs(conn, timeout_seconds, max_attempts):
+    """Give jobs back to the queue when their worker died mid-run."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE scoring_jobs
+        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+            error = CASE WHEN attempts >= %s THEN 'Worker stopped responding' ELSE error END,
+            worker_id = NULL
+        WHERE status = 'running' AND started_at < current_timestamp - make_interval(secs => %s)
+    """, (max_attempts, max_attempts, timeout_seconds))
+    count = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    return count
+
+
+def get_job(conn, job_id):
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, status, result, http_status, error, created_at, started_at, finished_at
+        FROM scoring_jobs
+        WHERE id = %s
+    """, (job_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    if not row:
+        return None
+    return {
+        "job_id": str(row[0]),
+        "status": row[1],
+        "result": row[2],
+        "http_status": row[3],
+        "error": row[4],
+        "created_at": row[5].isoformat() if row[5] else None,
+        "started_at": row[6].isoformat() if row[6] else None,
+        "finished_at": row[7].isoformat() if row[7] else None,
+    }
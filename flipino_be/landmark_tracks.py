@@ -0,0 +1,102 @@
+"""Landmark tracks extracted on the device, for /score_landmarks.
+
+A track is a sequence of frames, each with a timestamp in seconds and the 13
+LANDMARK_IDS landmarks as (x, y, z, visibility) in MediaPipe's normalized
+image coordinates. It arrives either as JSON:
+
+    {"figure": "TiklosBoyFig1.json", "user_id": "...",
+     "frames": [{"t": 0.0, "landmarks": [[x, y, z, visibility], ...]}, ...]}
+
+or as a packed little-endian body: the header below, then frame_count records
+of float32 [t, x0, y0, z0, v0, x1, ...].
+"""
+import struct
+
+import numpy as np
+
+from scoring import LANDMARK_IDS, MIRROR_IDS
+
+TRACK_MAGIC = b'FLPT'
+TRACK_VERSION = 1
+TRACK_HEADER = struct.Struct('<4sHHI')  # magic, version, landmarks per frame, frame count
+MAX_TRACK_FRAMES = 5000
+
+# Position in LANDMARK_IDS of each landmark's mirror counterpart
+MIRROR_ORDER = [LANDMARK_IDS.index(MIRROR_IDS[lid]) for lid in LANDMARK_IDS]
+
+
+def pack_track(times, landmarks):
+    """Encode (T,) timestamps and (T, 13, 4) landmarks in the packed format."""
+    landmarks = np.asarray(landmarks, dtype=np.float32).reshape(len(times), len(LANDMARK_IDS) * 4)
+    records = np.hstack([np.asarray(times, dtype=np.float32)[:, None], landmarks])
+    header = TRACK_HEADER.pack(TRACK_MAGIC, TRACK_VERSION, len(LANDMARK_IDS), len(times))
+    return header + records.astype('<f4').tobytes()
+
+
+def parse_packed_track(body):
+    """Decode a packed track into (times (T,), landmarks (T, 13, 4)); raises ValueError if malformed."""
+    if len(body) < TRACK_HEADER.size:
+        raise ValueError("Track body is too short")
+    magic, version, landmark_count, frame_count = TRACK_HEADER.unpack_from(body)
+    if magic != TRACK_MAGIC or version != TRACK_VERSION:
+        raise ValueError("Unknown track format")
+    if landmark_count != len(LANDMARK_IDS):
+        raise ValueError(f"Expected {len(LANDMARK_IDS)} landmarks per frame, got {landmark_count}")
+    if frame_count > MAX_TRACK_FRAMES:
+        raise ValueError(f"Track has more than {MAX_TRACK_FRAMES} frames")
+    record_size = 1 + landmark_count * 4
+    expected = TRACK_HEADER.size + frame_count * record_size * 4
+    if len(body) != expected:
+        raise ValueError(f"Track body should be {expected} bytes, got {len(body)}")
+    records = np.frombuffer(body, dtype='<f4', offset=TRACK_HEADER.size).reshape(frame_count, record_size)
+    return validate_track(records[:, 0], records[:, 1:].reshape(frame_count, landmark_count, 4))
+
+
+def parse_json_track(frames):
+    """Decode the JSON "frames" list into (times (T,), landmarks (T, 13, 4)); raises ValueError if malformed."""
+    if not isinstance(frames, list):
+        raise ValueError("frames must be a list")
+    if len(frames) > MAX_TRACK_FRAMES:
+        raise ValueError(f"Track has more than {MAX_TRACK_FRAMES} frames")
+    try:
+        times = np.array([frame["t"] for frame in frames], dtype=np.float64)
+        landmarks = np.array([frame["landmarks"] for frame in frames], dtype=np.float64)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Every frame needs a time 't' and 13 [x, y, z, visibility] landmarks")
+    if len(frames) == 0:
+        landmarks = landmarks.reshape(0, len(LANDMARK_IDS), 4)
+    if landmarks.shape[1:] != (len(LANDMARK_IDS), 4):
+        raise ValueError("Every frame needs a time 't' and 13 [x, y, z, visibility] landmarks")
+    return validate_track(times, landmarks)
+
+
+def validate_track(times, landmarks):
+    times = np.asarray(times, dtype=np.float64)
+    landmarks = np.asarray(landmarks, dtype=np.float64)
+    if not (np.all(np.isfinite(times)) and np.all(np.isfinite(landmarks))):
+        raise ValueError("Track contains NaN or infinite values")
+    if np.any(np.diff(times) < 0):
+        raise ValueError("Frame times must not go backwards")
+    return times, landmarks
+
+
+def track_poses(times, landmarks):
+    """Apply the server's visibility rules and build both tracks.
+
+    Mirrors extract_pose_landmarks: landmarks with visibility <= 0.5 become
+    (0, 0, 0) and frames with fewer than half the landmarks visible are
+    dropped. The mirrored track reflects x and swaps left/right landmarks.
+    Returns (user_poses, user_times, user_poses_flipped, user_times_flipped).
+    """
+    visible = landmarks[:, :, 3] > 0.5
+    keep = visible.sum(axis=1) >= len(LANDMARK_IDS) // 2
+    poses = np.where(visible[:, :, None], landmarks[:, :, :3], 0.0)
+
+    mirrored = landmarks[:, MIRROR_ORDER]
+    mirrored_visible = visible[:, MIRROR_ORDER]
+    mirrored_xyz = mirrored[:, :, :3].copy()
+    mirrored_xyz[:, :, 0] = 1.0 - mirrored_xyz[:, :, 0]
+    poses_flipped = np.where(mirrored_visible[:, :, None], mirrored_xyz, 0.0)
+
+    times = np.asarray(times, dtype=np.float64)
+    return poses[keep], times[keep], poses_flipped[keep], times[keep]
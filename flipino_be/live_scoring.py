@@ -0,0 +1,155 @@
+"""Score a performance while it's still being recorded, for the /live WebSocket.
+
+Frames arrive as device landmarks (JSON or packed chunks, see
+landmark_tracks.py) or as small encoded video frames that go through the pose
+pool here. Each valid pose is aligned on arrival against the figure, in both
+orientations, with OnlineDTW, so every message can be answered with a running
+score, how far into the figure the dancer is and a body-part hint. When the
+stream ends the alignment is already done and the final /upload result only
+costs the backtrack and feedback.
+"""
+import contextlib
+import queue
+import struct
+import sys
+
+import cv2
+import numpy as np
+
+from dtw import OnlineDTW
+from extractor import process_frame
+from landmark_tracks import MAX_TRACK_FRAMES, track_poses
+from scoring import as_pose_array, compare_dance, joint_angles, normalize_poses
+
+# Binary video frame message: little-endian float64 timestamp in seconds, then a JPEG/PNG image
+FRAME_HEADER = struct.Struct('<d')
+
+
+class LiveTrack:
+    """One orientation's poses so far and their alignment to the figure."""
+
+    def __init__(self, reference):
+        self.poses = []
+        self.times = []
+        self.alignment = OnlineDTW(reference.normalized.reshape(len(reference), -1))
+        self.frame_scores = []
+        self.hint = None
+
+
+class LiveSession:
+    """One stream's tracks and alignments; its video frames share one pose estimator until close()."""
+
+    def __init__(self, reference, pose_pool=None, mirror_mode='landmarks', inference_input=None,
+                 max_frames=MAX_TRACK_FRAMES, pose_wait=None):
+        self.reference = reference
+        self.pose_pool = pose_pool
+        self.mirror_mode = mirror_mode
+        self.inference_input = inference_input  # InferenceInput for video frames (its crop follows the stream)
+        self.max_frames = max_frames
+        self.pose_wait = pose_wait  # seconds to wait for a free estimator (None waits as long as it takes)
+        self.frames_received = 0
+        self.last_time = None
+        self.tracks = {'normal': LiveTrack(reference), 'flipped': LiveTrack(reference)}
+        self._pose = None
+        self._pose_lease = contextlib.ExitStack()
+
+    def add_landmarks(self, times, landmarks):
+        """Add device landmarks, (T,) times and (T, 13, 4) landmarks as parsed by landmark_tracks."""
+        self._check_times(times)
+        poses, poses_times, flipped, flipped_times = track_poses(times, landmarks)
+        self._add(self.tracks['normal'], poses, poses_times)
+        self._add(self.tracks['flipped'], flipped, flipped_times)
+
+    def add_video_frame(self, message):
+        """Add one binary video frame message (FRAME_HEADER timestamp, then the encoded image)."""
+        if self.pose_pool is None:
+            raise ValueError("Video frames are not accepted on this stream")
+        if len(message) <= FRAME_HEADER.size:
+            raise ValueError("Video frame message is too short")
+        (timestamp,) = FRAME_HEADER.unpack_from(message)
+        frame = cv2.imdecode(np.frombuffer(message, dtype=np.uint8, offset=FRAME_HEADER.size), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Could not decode the video frame")
+        self._check_times([timestamp])
+        if self._pose is None:
+            try:
+                self._pose = self._pose_lease.enter_context(self.pose_pool.acquire(self.pose_wait))
+            except queue.Empty:
+                raise ValueError("Every pose estimator is busy with another stream; send landmarks or retry")
+        try:
+            extracted, extracted_flipped = process_frame(self._pose, frame, self.mirror_mode, self.inference_input)
+        except BaseException:
+            # The pool replaces an estimator that failed; the next frame takes another one
+            self._pose = None
+            self._pose_lease.__exit__(*sys.exc_info())
+            self._pose_lease = contextlib.ExitStack()
+            raise
+        self._add(self.tracks['normal'], [extracted] if extracted else [], [timestamp])
+        self._add(self.tracks['flipped'], [extracted_flipped] if extracted_flipped else [], [timestamp])
+
+    def close(self):
+        """Give the pose estimator back to the pool (it's reset there)."""
+        self._pose = None
+        self._pose_lease.close()
+
+    def _check_times(self, times):
+        times = np.asarray(times, dtype=np.float64)
+        if len(times) == 0:
+            return
+        if not np.all(np.isfinite(times)) or np.any(np.diff(times) < 0) \
+                or (self.last_time is not None and times[0] < self.last_time):
+            raise ValueError("Frame times must be finite and must not go backwards")
+        if self.frames_received + len(times) > self.max_frames:
+            raise ValueError(f"Stream has more than {self.max_frames} frames")
+        self.frames_received += len(times)
+        self.last_time = float(times[-1])
+
+    def _add(self, track, poses, times):
+        if len(poses) == 0:
+            return
+        poses = as_pose_array(poses)
+        normalized = normalize_poses(poses)
+        angles = joint_angles(poses)
+        reference = self.reference
+        for pose, pose_normalized, pose_angles, timestamp in zip(poses, normalized, angles, times):
+            track.poses.append(pose)
+            track.times.append(float(timestamp))
+            track.alignment.append(pose_normalized.reshape(-1))
+            # Score the new frame against the figure frame it's matched to so far
+            j, _ = track.alignment.best_end()
+            score, feedback = compare_dance(pose_normalized[None], reference.normalized[j:j + 1].astype(np.float64),
+                                            pose_angles[None], reference.angles[j:j + 1].astype(np.float64),
+                                            [timestamp])
+            track.frame_scores.append(score)
+            if score < 100:
+                track.hint = feedback['body_part_feedback'][0]
+
+    def best_orientation(self):
+        def running_score(orientation):
+            scores = self.tracks[orientation].frame_scores
+            return sum(scores) / len(scores) if scores else -1.0
+        return max(self.tracks, key=running_score)
+
+    def progress(self):
+        """The running result sent back after every message."""
+        orientation = self.best_orientation()
+        track = self.tracks[orientation]
+        j, _ = track.alignment.best_end()
+        return {
+            'type': 'progress',
+            'frames': self.frames_received,
+            'poses': len(track.poses),
+            'orientation': orientation,
+            'partial_score': round(sum(track.frame_scores) / len(track.frame_scores), 2) if track.frame_scores else 0,
+            'figure_progress': round((j + 1) / len(self.reference), 2) if j is not None else 0,
+            'hint': track.hint,
+        }
+
+    def pose_tracks(self):
+        """(user_poses, user_times, user_poses_flipped, user_times_flipped) as score_pose_tracks takes them."""
+        normal, flipped = self.tracks['normal'], self.tracks['flipped']
+        return normal.poses, normal.times, flipped.poses, flipped.times
+
+    def alignments(self):
+        """Unbanded (cost, path) of both tracks against the figure, for score_pose_tracks."""
+        return [self.tracks['normal'].alignment.result(), self.tracks['flipped'].alignment.result()]
@@ -0,0 +1,143 @@
+"""In-process latency histograms and counters, served as Prometheus text by /metrics.
+
+span('dtw') times a block into the flipino_stage_seconds histogram and, when
+it runs inside a request, into that request's stage breakdown (printed for
+slow requests). Values are per process: with several gunicorn workers each
+scrape sees the worker that answered, so scrape workers individually or sum
+across them.
+"""
+import contextlib
+import contextvars
+import threading
+import time
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_histograms = {}  # name -> {labels: [bucket counts..., count, sum]}
+_counters = {}    # name -> {labels: value}
+_help = {}
+_gauge_sources = []
+_trace = contextvars.ContextVar('flipino_trace', default=None)
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def describe(name, text):
+    _help[name] = text
+
+
+def observe(name, seconds, **labels):
+    key = _labels(labels)
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        values = series.get(key)
+        if values is None:
+            values = series[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += 1
+        values[-1] += seconds
+
+
+def inc(name, amount=1, **labels):
+    key = _labels(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+def register_gauges(source):
+    """source() returns {metric name: value}; called on every scrape."""
+    _gauge_sources.append(source)
+
+
+def record_stage(stage, seconds, into=None):
+    """Record a stage that was timed elsewhere (e.g. on pipeline threads)."""
+    observe('flipino_stage_seconds', seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+    if into is not None:
+        into[stage] = into.get(stage, 0.0) + seconds
+
+
+@contextlib.contextmanager
+def span(stage, into=None):
+    """Time the block as `stage`; `into`, if given, is a dict that also gets the seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, into)
+
+
+def start_trace():
+    return _trace.set([])
+
+
+def finish_trace(token):
+    """Stop collecting and return the request's [(stage, seconds), ...]."""
+    trace = _trace.get() or []
+    _trace.reset(token)
+    return trace
+
+
+def format_breakdown(trace):
+    totals = {}
+    for stage, seconds in trace:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ' '.join(f"{stage}={seconds:.3f}s" for stage, seconds in totals.items())
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for name, series in sorted(_histograms.items()):
+            lines.append(f"# HELP {name} {_help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, values in sorted(series.items()):
+                for bound, count in zip(BUCKETS, values):
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', repr(bound))])} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {values[-2]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {values[-2]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]:.6f}")
+        for name, series in sorted(_counters.items()):
+            lines.append(f"# HELP {name} {_help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    for source in _gauge_sources:
+        try:
+            gauges = source()
+        except Exception as e:
+            print(f"⚠️ Metrics gauge source failed: {e}")
+            continue
+        for name, value in sorted(gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+describe('flipino_request_seconds', "Request latency by route, method and status")
+describe('flipino_stage_seconds', "Time spent in each scoring, database and Supabase stage")
+describe('flipino_frames_decoded_total', "Video frames decoded")
+describe('flipino_poses_extracted_total', "Valid poses extracted from video frames")
+describe('flipino_rejections_total', "Attempts scored 0 before alignment, by reason")
+describe('flipino_early_exits_total', "Videos whose extraction stopped early because rejection was certain, by reason")
+describe('flipino_errors_total', "Requests that ended in a 5xx, by route")
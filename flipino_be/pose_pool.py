@@ -0,0 +1,178 @@
+import contextlib
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class PoseModelUnavailable(RuntimeError):
+    """MediaPipe, or its legacy solutions API that Pose comes from, isn't installed."""
+
+
+def default_pose_factory(model_complexity):
+    try:
+        import mediapipe as mp
+        pose_solution = mp.solutions.pose
+    except (ImportError, AttributeError) as e:
+        raise PoseModelUnavailable(f"MediaPipe Pose is not available: {e}") from e
+    return pose_solution.Pose(model_complexity=model_complexity)
+
+
+class PosePool:
+    """A fixed set of pre-initialized MediaPipe Pose estimators for one worker process.
+
+    The pool size is also the worker's concurrency limit for pose inference:
+    uploads beyond it wait for an estimator instead of piling onto the CPU.
+    Estimators are reset when returned so tracking never leaks between videos.
+    """
+
+    def __init__(self, size=None, model_complexity=1, factory=None):
+        self.size = size or max(1, (os.cpu_count() or 2) // 2)
+        self.model_complexity = model_complexity
+        self.factory = factory or default_pose_factory
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._live = 0
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._hits = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+
+    def _create(self):
+        pose = self.factory(self.model_complexity)
+        with self._lock:
+            self._created += 1
+        return pose
+
+    def warm_up(self):
+        """Create every estimator now and push a blank frame through it to load the graph."""
+        blank = np.zeros((64, 64, 3), dtype=np.uint8)
+        while True:
+            with self._lock:
+                if self._live >= self.size:
+                    break
+                self._live += 1
+            try:
+                pose = self._create()
+                pose.process(blank)
+            except Exception:
+                with self._lock:
+                    self._live -= 1
+                raise
+            self._reset(pose)
+            self._idle.put(pose)
+        print(f"✅ Pose pool ready: {self.size} estimators (model_complexity={self.model_complexity})")
+        return self
+
+    @contextlib.contextmanager
+    def acquire(self, timeout=None):
+        pose = self._checkout(timeout)
+        healthy = False
+        try:
+            yield pose
+            healthy = True
+        finally:
+            self._checkin(pose, healthy)
+
+    def _checkout(self, timeout):
+        grow = False
+        with self._lock:
+            try:
+                pose = self._idle.get_nowait()
+            except queue.Empty:
+                pose = None
+                # Fill the pool up to size before anyone has to wait
+                grow = self._live < self.size
+                if grow:
+                    self._live += 1
+            if pose is not None or grow:
+                self._hits += 1
+                self._in_use += 1
+            else:
+                self._waits += 1
+                self._waiting += 1
+
+        if grow:
+            try:
+                return self._create()
+            except Exception:
+                with self._lock:
+                    self._live -= 1
+                    self._in_use -= 1
+                raise
+        if pose is not None:
+            return pose
+
+        start = time.monotonic()
+        try:
+            pose = self._idle.get(timeout=timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                self._wait_seconds += time.monotonic() - start
+        with self._lock:
+            self._in_use += 1
+        return pose
+
+    def _checkin(self, pose, healthy):
+        if healthy:
+            healthy = self._reset(pose)
+        if not healthy:
+            # Don't hand a half-broken graph to the next upload; replace it
+            self._close(pose)
+            try:
+                pose = self._create()
+            except Exception as e:
+                print(f"❌ Could not replace pose estimator: {e}")
+                with self._lock:
+                    self._live -= 1
+                    self._in_use -= 1
+                return
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(pose)
+
+    def _reset(self, pose):
+        try:
+            reset = getattr(pose, 'reset', None)
+            if reset is not None:
+                reset()
+            return True
+        except Exception as e:
+            print(f"⚠️ Pose estimator reset failed: {e}")
+            return False
+
+    def _close(self, pose):
+        try:
+            pose.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "model_complexity": self.model_complexity,
+                "live": self._live,
+                "created": self._created,
+                "idle": self._idle.qsize(),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "hits": self._hits,
+                "waits": self._waits,
+                "wait_seconds": round(self._wait_seconds, 3),
+            }
+
+    def close(self):
+        while True:
+            try:
+                pose = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(pose)
+            with self._lock:
+                self._live -= 1
@@ -0,0 +1,130 @@
+"""Per-user progress rollups in the progress table, kept up to date as attempts are saved.
+
+There is one row per user per figure, and one per user per dance with
+figure_name ''. Each row holds the attempt count, best and latest score, the
+score total (for the average) and the last attempt time. update_progress()
+adds a batch of new attempts in the transaction that saves them to
+user_history, so the rollups never drift from it. /progress then reads a
+user's rows with one lookup on the unique index. Rebuild the rollups from
+user_history with:
+
+    python progress.py [--user ID]
+"""
+import argparse
+import os
+
+from psycopg2.extras import execute_values
+
+
+def update_progress(cursor, rows):
+    """Add history rows (user_id, dance_name, figure_name, score, ...) to the rollups, in the caller's transaction."""
+    rollups = {}  # (user_id, dance_name, figure_name) -> [attempts, best, latest, total]
+    for user_id, dance_name, figure_name, score, *_ in rows:
+        if not user_id or not dance_name or not figure_name:
+            continue
+        score = float(score)
+        for key in ((user_id, dance_name, figure_name), (user_id, dance_name, '')):
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollups[key] = [1, score, score, score]
+            else:
+                rollup[0] += 1
+                rollup[1] = max(rollup[1], score)
+                rollup[2] = score  # rows are in the order they were recorded
+                rollup[3] += score
+    if not rollups:
+        return
+    # Sorted so concurrent writers lock the rows in the same order
+    execute_values(cursor, """
+        INSERT INTO progress (user_id, dance_name, figure_name, attempts, best_score, latest_score, total_score,
+                              last_attempt)
+        VALUES %s
+        ON CONFLICT (user_id, dance_name, figure_name) DO UPDATE SET
+            attempts = progress.attempts + EXCLUDED.attempts,
+            best_score = GREATEST(progress.best_score, EXCLUDED.best_score),
+            latest_score = EXCLUDED.latest_score,
+            total_score = progress.total_score + EXCLUDED.total_score,
+            last_attempt = EXCLUDED.last_attempt
+    """, [key + tuple(rollup) for key, rollup in sorted(rollups.items())],
+        template="(%s, %s, %s, %s, %s, %s, %s, current_timestamp)")
+
+
+def rebuild_progress(cursor, user_ids=None):
+    """Recompute the rollups of user_ids (or everyone) from user_history, in the caller's transaction.
+
+    The table lock holds back concurrent update_progress() calls until the
+    transaction ends, so attempts saved meanwhile are neither lost nor counted twice.
+    """
+    scope, params = "", []
+    if user_ids is not None:
+        scope, params = "AND user_id = ANY(%s::uuid[])", [list(user_ids)]
+    cursor.execute("LOCK TABLE progress IN SHARE ROW EXCLUSIVE MODE")
+    cursor.execute(f"DELETE FROM progress WHERE dance_name IS NOT NULL {scope}", params)
+    cursor.execute(f"""
+        INSERT INTO progress (user_id, dance_name, figure_name, attempts, best_score, latest_score, total_score,
+                              last_attempt)
+        SELECT user_id, dance_name, COALESCE(figure_name, ''), count(*), max(score),
+               (array_agg(score ORDER BY attempted_at DESC, id DESC))[1], sum(score), max(attempted_at)
+        FROM user_history
+        WHERE user_id IS NOT NULL AND dance_name IS NOT NULL AND figure_name IS NOT NULL AND score IS NOT NULL
+              {scope}
+        GROUP BY GROUPING SETS ((user_id, dance_name, figure_name), (user_id, dance_name))
+    """, params)
+    return cursor.rowcount
+
+
+def _rollup(row):
+    attempts, best, latest, total, last_attempt = row
+    return {
+        'attempts': attempts,
+        'best_score': float(best),
+        'latest_score': float(latest),
+        'average_score': round(float(total) / attempts, 2) if attempts else 0,
+        'last_attempt': last_attempt.isoformat() if last_attempt else None,
+    }
+
+
+def fetch_progress(conn, user_id, dance_name=None):
+    """A user's rollups as [{dance_name, ..., figures: [{figure_name, ...}]}], dances by name."""
+    conditions, params = ["user_id = %s", "dance_name IS NOT NULL"], [user_id]
+    if dance_name:
+        conditions.append("dance_name = %s")
+        params.append(dance_name)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT dance_name, figure_name, attempts, best_score, latest_score, total_score, last_attempt
+        FROM progress
+        WHERE {' AND '.join(conditions)}
+        ORDER BY dance_name, figure_name
+    """, params)
+    rows = cursor.fetchall()
+    cursor.close()
+
+    dances = {}
+    for dance, figure, *rollup in rows:
+        entry = dances.setdefault(dance, {'dance_name': dance, 'figures': []})
+        if figure:
+            entry['figures'].append(dict(_rollup(rollup), figure_name=figure))
+        else:
+            entry.update(_rollup(rollup))
+    return list(dances.values())
+
+
+if __name__ == '__main__':
+    import psycopg2
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Rebuild the progress rollups from user_history.")
+    parser.add_argument('--user', action='append', help="only this user (repeatable); default everyone")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+    try:
+        cursor = conn.cursor()
+        written = rebuild_progress(cursor, args.user)
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+    print(f"✅ Rebuilt {written} progress rows")
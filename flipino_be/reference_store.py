@@ -0,0 +1,314 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from scoring import ANGLE_NAMES, normalize_poses, joint_angles
+
+
+def figure_key(figure):
+    """Figures are requested as 'TiklosBoyFig1.json'; store them under 'TiklosBoyFig1'."""
+    name = os.path.basename(figure or '')
+    if name.lower().endswith('.json'):
+        name = name[:-5]
+    return name
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def parse_figure_json(data, landmark_ids):
+    """Turn a figure JSON list into a float32 (frames, len(landmark_ids), 3) array.
+
+    Missing landmarks and null z values become 0.0, like extract_landmarks_by_id did.
+    """
+    frames = []
+    for pose in data:
+        if not isinstance(pose, dict) or "landmarks" not in pose:
+            print(f"⚠️ Invalid pose format: {pose}")
+            continue
+        id_map = {lm.get('id'): lm for lm in pose["landmarks"] if 'id' in lm}
+        frames.append([
+            (id_map.get(i, {}).get('x', 0.0) or 0.0,
+             id_map.get(i, {}).get('y', 0.0) or 0.0,
+             id_map.get(i, {}).get('z', 0.0) or 0.0)
+            for i in landmark_ids
+        ])
+    return np.asarray(frames, dtype=np.float32).reshape(-1, len(landmark_ids), 3)
+
+
+class ReferenceFigure:
+    """One reference figure: raw poses, normalized poses and joint angles, all precomputed."""
+
+    def __init__(self, name, poses, normalized=None, angles=None, mtime=None, digest=None):
+        self.name = name
+        self.poses = poses
+        self.normalized = normalized if normalized is not None else normalize_poses(poses).astype(np.float32)
+        self.angles = angles if angles is not None else joint_angles(poses).astype(np.float32)
+        self.mtime = mtime
+        self.digest = digest
+
+    def __len__(self):
+        return len(self.poses)
+
+
+class ReferenceStore:
+    """Reference figures from dance_poses/*.json, parsed once and kept in memory.
+
+    A figure is re-read only when its file's mtime changes and its content hash
+    differs; files are stat'ed at most once every check_interval seconds.
+    """
+
+    def __init__(self, directory, landmark_ids, check_interval=5.0):
+        self.directory = directory
+        self.landmark_ids = list(landmark_ids)
+        self.check_interval = check_interval
+        self._figures = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+
+    def load_all(self):
+        if not os.path.isdir(self.directory):
+            print(f"❌ Dance poses folder not found: {self.directory}")
+            return self
+        for filename in sorted(os.listdir(self.directory)):
+            if filename.lower().endswith('.json'):
+                self._load(figure_key(filename))
+        print(f"✅ Loaded {len(self._figures)} reference figures from {self.directory}")
+        return self
+
+    def names(self):
+        return sorted(self._figures)
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, figure):
+        """Return the ReferenceFigure for 'Name' or 'Name.json', or None if it doesn't exist."""
+        key = figure_key(figure)
+        if not key:
+            return None
+        now = time.monotonic()
+        if key in self._figures and now - self._checked_at.get(key, 0.0) < self.check_interval:
+            return self._figures[key]
+        return self._load(key)
+
+    def _load(self, key):
+        path = self.path_for(key)
+        with self._lock:
+            self._checked_at[key] = time.monotonic()
+            current = self._figures.get(key)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                self._figures.pop(key, None)
+                return None
+            if current is not None and current.mtime == mtime:
+                return current
+            try:
+                digest = file_digest(path)
+                if current is not None and current.digest == digest:
+                    current.mtime = mtime
+                    return current
+                with open(path, 'r') as f:
+                    poses = parse_figure_json(json.load(f), self.landmark_ids)
+            except Exception as e:
+                print(f"❌ Error loading reference figure {key}: {e}")
+                return current
+            figure = ReferenceFigure(key, poses, mtime=mtime, digest=digest)
+            self._figures[key] = figure
+            if current is not None:
+                print(f"🔄 Reloaded reference figure {key} ({len(figure)} frames)")
+            return figure
+
+
+# Packed format: a fixed preamble, a JSON index of figure name -> float32 offset/frames,
+# then one contiguous float32 block per figure holding poses, normalized poses and angles.
+PACK_MAGIC = b'FLPK'
+PACK_VERSION = 1
+PACK_PREAMBLE = struct.Struct('<4sIII')  # magic, version, landmark count, index length
+PACK_ALIGN = 64
+
+
+def write_pack(path, figures, landmark_ids):
+    """Write ReferenceFigures into one packed file, atomically replacing path."""
+    index, blocks, offset = {}, [], 0
+    for figure in figures:
+        block = np.concatenate([
+            np.ascontiguousarray(figure.poses, dtype=np.float32).ravel(),
+            np.ascontiguousarray(figure.normalized, dtype=np.float32).ravel(),
+            np.ascontiguousarray(figure.angles, dtype=np.float32).ravel(),
+        ])
+        index[figure.name] = {"offset": offset, "frames": len(figure), "digest": figure.digest, "mtime": figure.mtime}
+        blocks.append(block)
+        offset += block.size
+    header = json.dumps({"landmark_ids": list(landmark_ids), "figures": index}).encode('utf-8')
+    data_start = PACK_PREAMBLE.size + len(header)
+    padding = -data_start % PACK_ALIGN
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PACK_PREAMBLE.pack(PACK_MAGIC, PACK_VERSION, len(landmark_ids), len(header)))
+        f.write(header)
+        f.write(b'\0' * padding)
+        for block in blocks:
+            f.write(block.tobytes())
+    # Replace rather than rewrite so processes still mapping the old file keep valid pages
+    os.replace(tmp_path, path)
+    return path
+
+
+class PackedReferenceStore:
+    """Reference figures served as zero-copy views into a memory-mapped pack file.
+
+    Every worker process maps the same file, so the landmark data lives once in
+    the page cache. Figures missing from the pack fall back to the JSON store,
+    and so do figures whose JSON file was edited after the pack was built
+    (checked by mtime, then content hash, at most every check_interval seconds).
+    """
+
+    def __init__(self, path, fallback=None, check_interval=5.0):
+        self.path = path
+        self.fallback = fallback
+        self.check_interval = check_interval
+        self._figures = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._json_mtimes = {}  # name -> (JSON mtime when last checked, whether the packed figure is current)
+        self._json_checked_at = {}
+        self._lock = threading.Lock()
+
+    def load_all(self):
+        with self._lock:
+            self._open()
+        print(f"✅ Mapped {len(self._figures)} reference figures from {self.path}")
+        for name in sorted(self._figures):
+            self._packed_is_current(name, self._figures[name])
+        return self
+
+    def _open(self):
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, 'rb') as f:
+            magic, version, landmark_count, index_len = PACK_PREAMBLE.unpack(f.read(PACK_PREAMBLE.size))
+            if magic != PACK_MAGIC or version != PACK_VERSION:
+                raise ValueError(f"Not a version {PACK_VERSION} pose pack: {self.path}")
+            header = json.loads(f.read(index_len).decode('utf-8'))
+        data_start = PACK_PREAMBLE.size + index_len
+        data_start += -data_start % PACK_ALIGN
+        data = np.memmap(self.path, dtype=np.float32, mode='r', offset=data_start)
+
+        figures = {}
+        pose_size = landmark_count * 3
+        for name, entry in header["figures"].items():
+            frames, offset = entry["frames"], entry["offset"]
+            poses = data[offset:offset + frames * pose_size].reshape(frames, landmark_count, 3)
+            offset += frames * pose_size
+            normalized = data[offset:offset + frames * pose_size].reshape(frames, landmark_count, 3)
+            offset += frames * pose_size
+            angles = data[offset:offset + frames * len(ANGLE_NAMES)].reshape(frames, len(ANGLE_NAMES))
+            figures[name] = ReferenceFigure(name, poses, normalized, angles, mtime, entry.get("digest"))
+        self.landmark_ids = header["landmark_ids"]
+        self._figures = figures
+        self._mtime = mtime
+        self._json_mtimes = {name: (entry.get("mtime"), True) for name, entry in header["figures"].items()}
+        self._json_checked_at = {}
+
+    def _packed_is_current(self, name, figure):
+        """False if the figure's JSON file now differs from what was packed."""
+        if self.fallback is None:
+            return True
+        now = time.monotonic()
+        checked = self._json_mtimes.get(name, (None, True))
+        if now - self._json_checked_at.get(name, -self.check_interval) < self.check_interval:
+            return checked[1]
+        self._json_checked_at[name] = now
+        path = self.fallback.path_for(name)
+        try:
+            mtime = os.stat(path).st_mtime
+            if mtime == checked[0]:
+                return checked[1]
+            current = file_digest(path) == figure.digest
+        except OSError:
+            return True  # no JSON next to the pack: the pack is all there is
+        if not current and checked[1]:
+            print(f"⚠️ {name}.json changed since {self.path} was built; using the JSON until the pack is rebuilt")
+        self._json_mtimes[name] = (mtime, current)
+        return current
+
+    def names(self):
+        names = set(self._figures)
+        if self.fallback is not None:
+            names.update(self.fallback.names())
+        return sorted(names)
+
+    def get(self, figure):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                self._checked_at = now
+                try:
+                    if os.stat(self.path).st_mtime != self._mtime:
+                        self._open()
+                        print(f"🔄 Remapped reference pack {self.path}")
+                except (OSError, ValueError) as e:
+                    print(f"❌ Error remapping reference pack: {e}")
+        key = figure_key(figure)
+        found = self._figures.get(key)
+        if (found is None or not self._packed_is_current(key, found)) and self.fallback is not None:
+            return self.fallback.get(figure)
+        return found
+
+
+def ensure_pack(path, directory, landmark_ids):
+    """Build the pack from directory's JSON if it's missing, for other landmarks or out of date; True if built."""
+    json_store = ReferenceStore(directory, landmark_ids)
+    names = sorted(figure_key(filename) for filename in os.listdir(directory) if filename.lower().endswith('.json'))
+    try:
+        packed = PackedReferenceStore(path, fallback=json_store)
+        with packed._lock:
+            packed._open()
+        if (packed.landmark_ids == list(landmark_ids) and sorted(packed._figures) == names
+                and all(packed._packed_is_current(name, figure) for name, figure in packed._figures.items())):
+            return False
+    except (OSError, ValueError):
+        pass
+    figures = [figure for figure in (json_store.get(name) for name in names) if figure is not None]
+    write_pack(path, figures, landmark_ids)
+    print(f"📦 Packed {len(figures)} reference figures into {path}")
+    return True
+
+
+def open_reference_store(directory, landmark_ids, pack_path=None):
+    """Prefer the packed file when it exists and matches landmark_ids, else parse the JSON."""
+    json_store = ReferenceStore(directory, landmark_ids)
+    if pack_path and os.path.exists(pack_path):
+        try:
+            store = PackedReferenceStore(pack_path, fallback=json_store).load_all()
+            if store.landmark_ids == list(landmark_ids):
+                return store
+            print(f"⚠️ {pack_path} was built for other landmarks, using JSON figures")
+        except (OSError, ValueError) as e:
+            print(f"❌ Error opening reference pack: {e}")
+    return json_store.load_all()
+
+
+if __name__ == '__main__':
+    from scoring import LANDMARK_IDS
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Convert dance_poses/*.json into the packed reference format.")
+    parser.add_argument('--src', default=os.path.join(here, 'dance_poses'), help="folder of figure JSON files")
+    parser.add_argument('--out', default=os.path.join(here, 'dance_poses.pack'), help="packed file to write")
+    args = parser.parse_args()
+
+    store = ReferenceStore(args.src, LANDMARK_IDS).load_all()
+    figures = [store.get(name) for name in store.names()]
+    write_pack(args.out, figures, LANDMARK_IDS)
+    print(f"✅ Packed {len(figures)} figures into {args.out} ({os.path.getsize(args.out)} bytes)")
@@ -0,0 +1,161 @@
+"""Re-score stored attempts from their saved pose tracks, without decoding any video.
+
+After changing compare_dance or the DTW scoring, bump SCORING_VERSION in
+scoring.py and run this: every attempt in user_history scored by another
+version whose tracks were saved (see TRACK_DIR in scoring_service.py) is
+scored again on a pool of processes, and the new scores are written back in
+batches, tagged with the new scoring_version; the affected users' progress
+rollups are rebuilt at the end. Attempts served from the result cache share
+the tracks of the attempt that was scored; attempts recorded before tracks
+were kept are left as they are.
+
+    python rescore.py [--user ID] [--figure NAME] [--since 2025-01-01] [--all] [--workers 8] [--dry-run]
+"""
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+from progress import rebuild_progress
+from scoring import SCORING_VERSION
+from scoring_service import reference_store, score_pose_tracks, track_store
+
+CHUNK_SIZE = 200  # attempts per pool task
+
+
+def init_worker():
+    # score_pose_tracks logs every attempt; thousands of those lines per second only slow the job down
+    sys.stdout = open(os.devnull, 'w')
+
+
+def rescore_chunk(attempts):
+    """Runs in a pool process: [(attempt_id, old_score, new_score or None, status), ...]."""
+    results = []
+    for attempt_id, figure, old_score in attempts:
+        reference = reference_store.get(figure)
+        if reference is None:
+            results.append((attempt_id, old_score, None, 'unknown_figure'))
+            continue
+        tracks = track_store.load(attempt_id)
+        if tracks is None:
+            results.append((attempt_id, old_score, None, 'no_tracks'))
+            continue
+        try:
+            accuracy, _ = score_pose_tracks(*tracks, reference)
+        except Exception as e:
+            print(f"❌ Attempt {attempt_id}: {e}", file=sys.stderr)
+            results.append((attempt_id, old_score, None, 'error'))
+            continue
+        results.append((attempt_id, old_score, round(accuracy, 2), 'rescored'))
+    return results
+
+
+def select_attempts(conn, user_id=None, figure=None, since=None, everything=False, limit=None):
+    """[(attempt_id, figure_name, score), ...] to re-score."""
+    conditions = ["figure_name IS NOT NULL"]
+    params = []
+    if not everything:
+        conditions.append("scoring_version IS DISTINCT FROM %s")
+        params.append(SCORING_VERSION)
+    if user_id:
+        conditions.append("user_id = %s")
+        params.append(user_id)
+    if figure:
+        conditions.append("figure_name = %s")
+        params.append(figure)
+    if since:
+        conditions.append("attempted_at >= %s")
+        params.append(since)
+    query = f"SELECT id, figure_name, score FROM user_history WHERE {' AND '.join(conditions)} ORDER BY id"
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    rows = [(str(attempt_id), figure_name, score) for attempt_id, figure_name, score in cursor.fetchall()]
+    cursor.close()
+    return rows
+
+
+def write_scores(conn, scores):
+    """Write [(attempt_id, score), ...] with this SCORING_VERSION in one transaction; returns the users touched."""
+    cursor = conn.cursor()
+    users = execute_values(cursor, """
+        UPDATE user_history AS h SET score = v.score, scoring_version = v.scoring_version
+        FROM (VALUES %s) AS v(id, score, scoring_version)
+        WHERE h.id = v.id
+        RETURNING h.user_id
+    """, [(attempt_id, score, SCORING_VERSION) for attempt_id, score in scores],
+        template="(%s::uuid, %s::numeric, %s::integer)", fetch=True)
+    conn.commit()
+    cursor.close()
+    return {str(user_id) for (user_id,) in users if user_id}
+
+
+def rescore(conn, attempts, workers, batch_size=1000, dry_run=False):
+    """Re-score attempts on `workers` processes, writing every batch_size new scores; returns a summary dict."""
+    started = time.perf_counter()
+    counts = {'rescored': 0, 'changed': 0, 'no_tracks': 0, 'unknown_figure': 0, 'error': 0}
+    total_change = 0.0
+    pending = []
+    users = set()
+    chunks = [attempts[i:i + CHUNK_SIZE] for i in range(0, len(attempts), CHUNK_SIZE)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, min(workers, len(chunks))),
+                                                initializer=init_worker) as pool:
+        for results in pool.map(rescore_chunk, chunks):
+            for attempt_id, old_score, new_score, status in results:
+                counts[status] += 1
+                if new_score is None:
+                    continue
+                change = abs(new_score - float(old_score or 0))
+                total_change += change
+                counts['changed'] += change > 0
+                pending.append((attempt_id, new_score))
+            if len(pending) >= batch_size and not dry_run:
+                users |= write_scores(conn, pending)
+                pending = []
+    if pending and not dry_run:
+        users |= write_scores(conn, pending)
+    if users:
+        cursor = conn.cursor()
+        rebuild_progress(cursor, sorted(users))
+        conn.commit()
+        cursor.close()
+
+    seconds = time.perf_counter() - started
+    return dict(counts, attempts=len(attempts), users=len(users), seconds=round(seconds, 2),
+                attempts_per_second=round(len(attempts) / seconds, 1) if seconds else 0,
+                mean_abs_change=round(total_change / counts['rescored'], 3) if counts['rescored'] else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--user', help="only this user's attempts")
+    parser.add_argument('--figure', help="only attempts at this figure, e.g. TiklosBoyFig1.json")
+    parser.add_argument('--since', help="only attempts at or after this time, e.g. 2025-01-01")
+    parser.add_argument('--all', action='store_true', help=f"also attempts already scored by version {SCORING_VERSION}")
+    parser.add_argument('--limit', type=int, help="at most this many attempts")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="scoring processes")
+    parser.add_argument('--batch-size', type=int, default=1000, help="scores written per transaction")
+    parser.add_argument('--dry-run', action='store_true', help="report how scores would change without writing")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+    try:
+        attempts = select_attempts(conn, args.user, args.figure, args.since, args.all, args.limit)
+        print(f"🔁 Re-scoring {len(attempts)} attempts with scoring version {SCORING_VERSION} "
+              f"on {args.workers} processes{' (dry run)' if args.dry_run else ''}")
+        summary = rescore(conn, attempts, args.workers, args.batch_size, args.dry_run)
+    finally:
+        conn.close()
+    print(f"✅ {summary}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import numpy as np
+
+LANDMARK_IDS = [0, 11, 12, 13, 14, 15, 16, 23, 24, 25, 26, 27, 28]  # Also what build_references.py extracts
+LANDMARK_NAMES = {
+    0: "Head",
+    11: "Left Shoulder",
+    12: "Right Shoulder",
+    13: "Left Elbow",
+    14: "Right Elbow",
+    15: "Left Wrist",
+    16: "Right Wrist",
+    23: "Left Hip",
+    24: "Right Hip",
+    25: "Left Knee",
+    26: "Right Knee",
+    27: "Left Ankle",
+    28: "Right Ankle"
+}
+
+# Each landmark's counterpart on the other side of the body, for mirroring a pose
+MIRROR_IDS = {0: 0, 11: 12, 12: 11, 13: 14, 14: 13, 15: 16, 16: 15,
+              23: 24, 24: 23, 25: 26, 26: 25, 27: 28, 28: 27}
+
+# Joint angle triplets (a, b, c) as indices into a LANDMARK_IDS-ordered pose;
+# the angle is measured at b.
+ANGLE_NAMES = ['left_hip', 'right_hip', 'left_shoulder', 'right_shoulder', 'hip_spread']
+ANGLE_A = [1, 2, 0, 0, 3]
+ANGLE_B = [3, 4, 1, 2, 0]
+ANGLE_C = [5, 6, 3, 4, 4]
+
+# Bump whenever a change alters scores or feedback, so cached and stored results are recomputed
+SCORING_VERSION = 1
+
+# Fewer valid poses than this in both orientations is rejected as no body detected
+MIN_VALID_POSES = 5
+
+FRAME_THRESHOLD = 0.9  # Average normalized landmark error that still scores a full frame
+
+# Poses sampled per second of video. 6 matches the every-5th-frame sampling of the
+# 30 fps recordings the reference figures were built from.
+POSES_PER_SECOND = 6.0
+
+
+def as_pose_array(poses):
+    """Turn a list of poses (lists of (x, y, z)) into a float64 (T, L, 3) array."""
+    arr = np.asarray(poses, dtype=np.float64)
+    if arr.size == 0:
+        return np.zeros((0, len(LANDMARK_IDS), 3))
+    return arr
+
+
+def normalize_poses(poses):
+    """Center every pose on the shoulder midpoint and scale by shoulder width."""
+    poses = np.asarray(poses, dtype=np.float64)
+    if len(poses) == 0:
+        return poses
+    center = (poses[:, 1] + poses[:, 2]) / 2
+    scale = np.linalg.norm(poses[:, 1] - poses[:, 2], axis=1)
+    scale[scale == 0] = 1.0
+    return (poses - center[:, None, :]) / scale[:, None, None]
+
+
+def joint_angles(poses):
+    """Joint angles in degrees for a (T, L, 3) array, returns (T, len(ANGLE_NAMES))."""
+    poses = np.asarray(poses, dtype=np.float64)
+    if len(poses) == 0:
+        return np.zeros((0, len(ANGLE_NAMES)))
+    ba = poses[:, ANGLE_A] - poses[:, ANGLE_B]
+    bc = poses[:, ANGLE_C] - poses[:, ANGLE_B]
+    cosine_angle = np.sum(ba * bc, axis=2) / (
+        np.linalg.norm(ba, axis=2) * np.linalg.norm(bc, axis=2) + 1e-8)
+    return np.degrees(np.arccos(np.clip(cosine_angle, -1.0, 1.0)))
+
+
+def movement_amount(normalized):
+    """Mean distance between consecutive normalized poses."""
+    if len(normalized) < 2:
+        return 0.0
+    steps = (normalized[1:] - normalized[:-1]).reshape(len(normalized) - 1, -1)
+    return float(np.mean(np.linalg.norm(steps, axis=1)))
+
+
+def column_means(values, width):
+    """Mean of each column of a (T, width) array, 0.0 for every column when T == 0."""
+    if len(values) == 0:
+        return np.zeros(width)
+    # Contiguous rows so each mean reduces the same way np.mean does on a list
+    return np.ascontiguousarray(values.T).mean(axis=1)
+
+
+def compare_dance(user_normalized, ref_normalized, user_angles, ref_angles, user_times=None):
+    """Score aligned frames and build the feedback dict.
+
+    All inputs are arrays already aligned frame by frame; extra frames on the
+    longer side are ignored. Normalized poses are (T, L, 3), angles (T, A) and
+    user_times the video time in seconds of each user frame (assumed evenly
+    sampled at POSES_PER_SECOND when not given).
+    """
+    matched_frames = min(len(user_normalized), len(ref_normalized))
+    user_normalized, ref_normalized = user_normalized[:matched_frames], ref_normalized[:matched_frames]
+    user_angles, ref_angles = user_angles[:matched_frames], ref_angles[:matched_frames]
+    if user_times is None:
+        user_times = np.arange(matched_frames) / POSES_PER_SECOND
+
+    differences = np.linalg.norm(user_normalized - ref_normalized, axis=2)  # (T, L)
+    frame_scores = differences.mean(axis=1)
+    scores = np.where(frame_scores < FRAME_THRESHOLD, 1.0,
+                      np.maximum(0, 1 - (frame_scores - FRAME_THRESHOLD)))
+
+    avg_landmark_errors = column_means(differences, len(LANDMARK_IDS))
+    worst_landmarks = sorted(
+        ((LANDMARK_NAMES.get(lid, str(lid)), err) for lid, err in zip(LANDMARK_IDS, avg_landmark_errors.tolist())),
+        key=lambda x: -x[1])
+
+    # Only return top 3 worst frames
+    worst_frames = np.argsort(-frame_scores, kind='stable')[:3]
+    top_feedback = [dict(zip(LANDMARK_IDS, differences[f].tolist())) for f in worst_frames]
+
+    # --- Angle feedback: average error per angle ---
+    avg_angle_errors = {}
+    if matched_frames:
+        angle_means = column_means(np.abs(user_angles - ref_angles), len(ANGLE_NAMES))
+        avg_angle_errors = dict(zip(ANGLE_NAMES, angle_means.tolist()))
+
+    # --- Body part specific, time-stamped feedback ---
+    body_part_feedback = []
+    for f in worst_frames:
+        worst_lid = LANDMARK_IDS[int(np.argmax(differences[f]))]
+        part_name = LANDMARK_NAMES.get(worst_lid, f"Landmark {worst_lid}")
+        time_sec = float(user_times[f])
+        body_part_feedback.append(
+            f"At {time_sec:.1f}s, your {part_name.lower()} needs improvement."
+        )
+
+    feedback = {
+        "worst_landmarks": worst_landmarks[:3],
+        "frame_feedback": top_feedback,
+        "angle_errors": avg_angle_errors,
+        "body_part_feedback": body_part_feedback
+    }
+
+    return float(scores.mean()) * 100 if matched_frames else 0.0, feedback
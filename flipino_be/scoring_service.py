@@ -0,0 +1,289 @@
+"""The CV and scoring runtime: OpenCV, MediaPipe, NumPy, reference figures and the pose pool.
+
+app.py imports this on first use (see app.scoring) so that processes serving
+only the light endpoints never pay for it; the scoring role loads and warms it
+at startup instead.
+"""
+import atexit
+import os
+
+import cv2
+import numpy as np
+
+from reference_store import ensure_pack, open_reference_store, figure_key
+from scoring import (LANDMARK_IDS, MIN_VALID_POSES, POSES_PER_SECOND, SCORING_VERSION, as_pose_array, normalize_poses, joint_angles,
+                     movement_amount, compare_dance)
+from dtw import dtw_batch, dtw_similarity
+from pose_pool import PosePool
+from extractor import InferenceInput, NoBodyGate, extract_pose_tracks
+from landmark_tracks import TRACK_MAGIC, parse_json_track, parse_packed_track, track_poses
+from metrics import inc, record_stage, span
+from figure_index import FigureIndex
+from live_scoring import LiveSession
+from track_store import TrackStore
+
+# How the mirrored track is built: 'landmarks' reflects the detected landmarks,
+# 'inference' runs MediaPipe a second time on the flipped frame. On the 11 sample uploads
+# (compare_mirror_modes.py) 'landmarks' scored 1.2-1.7x faster, with a mean absolute score
+# difference of 2.7 points; one video moved by 15 points and the 5 with no body stayed at 0.
+MIRROR_MODE = os.getenv('MIRROR_MODE', 'landmarks')
+
+# Poses extracted per second of video, whatever the phone's frame rate
+SAMPLE_POSES_PER_SECOND = float(os.getenv('POSES_PER_SECOND', POSES_PER_SECOND))
+
+# Decoding runs on its own thread; these inference workers each hold a pooled estimator.
+# Keep 1 to get exactly the serial landmark sequence (each estimator tracks independently).
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', '1'))
+EXTRACT_QUEUE_SIZE = int(os.getenv('EXTRACT_QUEUE_SIZE', '8'))
+
+# Frames are downscaled so their longer side is at most this many pixels before inference (0 keeps
+# the capture resolution). MediaPipe shrinks frames for its models itself, so this only pays off well
+# above the app's 720p recordings (4K: ~43 -> 33 ms/frame), and it moves scores by a couple of points.
+MAX_INFERENCE_DIM = int(os.getenv('MAX_INFERENCE_DIM', '0'))
+# Crop each frame to the previous pose's bounding box grown by this fraction per side; 0 turns it off
+ROI_MARGIN = float(os.getenv('ROI_MARGIN', '0'))
+
+# Stop extracting (and reject as no body detected) when this many sampled frames in a row from the
+# start have no pose in either orientation. Off (0) by default: a dancer who walks in later would be
+# scored by a full read, so a budget changes results; rejections that are already certain still stop early.
+NO_BODY_FRAME_BUDGET = int(os.getenv('NO_BODY_FRAME_BUDGET', '0'))
+
+# Sakoe-Chiba band half width in frames for DTW alignment; unset means unconstrained
+DTW_BAND = int(os.getenv('DTW_BAND', '0')) or None
+
+# Everything besides the video and figure an upload's score depends on; cached results are keyed by it,
+# so changing a setting above (or bumping SCORING_VERSION) stops serving scores made under the old one
+RESULT_CACHE_VERSION = '|'.join(str(setting) for setting in (
+    SCORING_VERSION, MIRROR_MODE, SAMPLE_POSES_PER_SECOND, EXTRACT_WORKERS, MAX_INFERENCE_DIM, ROI_MARGIN,
+    NO_BODY_FRAME_BUDGET, DTW_BAND))
+
+DANCE_POSES_DIR = os.path.join(os.path.dirname(__file__), 'dance_poses')
+# Built by `python reference_store.py`; shared read-only across worker processes via mmap
+DANCE_POSES_PACK = os.path.join(os.path.dirname(__file__), 'dance_poses.pack')
+
+# Each recorded attempt's pose tracks are saved here by attempt id, for rescore.py; '' turns saving off.
+# Async workers on other machines save to their own disk, so point them all at shared storage.
+TRACK_DIR = os.getenv('TRACK_DIR', os.path.join(os.path.dirname(__file__), 'uploads', 'tracks'))
+track_store = TrackStore(TRACK_DIR)
+
+# Reference figures are loaded once here (packed file if present) and looked up by name on each upload
+reference_store = open_reference_store(DANCE_POSES_DIR, LANDMARK_IDS, DANCE_POSES_PACK)
+
+# Pose estimators are built per worker process (don't preload the app before forking).
+# The pool size caps concurrent inference on this worker.
+POSE_POOL_SIZE = int(os.getenv('POSE_POOL_SIZE', '0')) or None
+POSE_MODEL_COMPLEXITY = int(os.getenv('POSE_MODEL_COMPLEXITY', '1'))
+pose_pool = PosePool(POSE_POOL_SIZE, POSE_MODEL_COMPLEXITY)
+atexit.register(pose_pool.close)
+
+# A /live video stream keeps one estimator for as long as it runs, so streams take theirs from a pool of
+# their own and never hold one an upload is waiting for. Estimators are only built once a stream asks;
+# a stream that finds them all taken waits LIVE_POSE_WAIT seconds for one, then its frames are refused.
+LIVE_POSE_POOL_SIZE = int(os.getenv('LIVE_POSE_POOL_SIZE', '0')) or None
+LIVE_POSE_WAIT = float(os.getenv('LIVE_POSE_WAIT', '5'))  # seconds
+live_pose_pool = PosePool(LIVE_POSE_POOL_SIZE, POSE_MODEL_COMPLEXITY)
+atexit.register(live_pose_pool.close)
+
+# /recognize searches every figure with this DTW band (frames); narrower prunes more candidates
+RECOGNIZE_BAND = int(os.getenv('RECOGNIZE_BAND', '12')) or None
+figure_index = FigureIndex(reference_store, RECOGNIZE_BAND)
+
+
+def extract_video_tracks(video_path, mirror_mode=None, stage_times=None, max_dim=None, roi_margin=None):
+    """(user_poses, user_times, user_poses_flipped, user_times_flipped) of a video, or None if it can't be opened.
+
+    max_dim and roi_margin override MAX_INFERENCE_DIM and ROI_MARGIN.
+    """
+    mirror_mode = mirror_mode or MIRROR_MODE
+    max_dim = MAX_INFERENCE_DIM if max_dim is None else max_dim
+    roi_margin = ROI_MARGIN if roi_margin is None else roi_margin
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print("❌ Error: Could not open video.")
+        inc('flipino_rejections_total', reason='video_error')
+        return None
+
+    try:
+        user_poses, user_times, user_poses_flipped, user_times_flipped, stats = extract_pose_tracks(
+            cap, pose_pool, mirror_mode, SAMPLE_POSES_PER_SECOND,
+            workers=EXTRACT_WORKERS, queue_size=EXTRACT_QUEUE_SIZE,
+            gate=NoBodyGate(cap, SAMPLE_POSES_PER_SECOND, MIN_VALID_POSES, NO_BODY_FRAME_BUDGET),
+            max_dim=max_dim, roi_margin=roi_margin)
+    finally:
+        cap.release()
+    print(f"📊 Total valid user poses extracted: {len(user_poses)} (normal), {len(user_poses_flipped)} (flipped)")
+    print(f"⏱️ Extraction: {stats.as_dict()}")
+    record_stage('decode', stats.decode_seconds, stage_times)
+    record_stage('inference', stats.inference_seconds, stage_times)
+    inc('flipino_frames_decoded_total', stats.frames_decoded)
+    inc('flipino_poses_extracted_total', len(user_poses))
+    if stats.stopped_early:
+        print(f"⏹️ Stopped extracting early: {stats.stopped_early}")
+        inc('flipino_early_exits_total', reason=stats.stopped_early)
+    return user_poses, user_times, user_poses_flipped, user_times_flipped
+
+def save_tracks(attempt_id, tracks):
+    """Keep an attempt's (user_poses, user_times, user_poses_flipped, user_times_flipped) for re-scoring."""
+    if not TRACK_DIR or not attempt_id:
+        return
+    try:
+        with span('save_tracks'):
+            track_store.save(attempt_id, *tracks)
+    except Exception as e:
+        print(f"⚠️ Could not save pose tracks for attempt {attempt_id}: {e}")
+
+def link_tracks(source_id, attempt_id):
+    """Share the tracks saved for source_id with attempt_id; False if attempt_id needs tracks it can't get."""
+    if not TRACK_DIR or not attempt_id:
+        return True
+    if not source_id:
+        return False
+    try:
+        return track_store.link(source_id, attempt_id)
+    except Exception as e:
+        print(f"⚠️ Could not share pose tracks of attempt {source_id} with {attempt_id}: {e}")
+        return False
+
+def process_video(video_path, reference, mirror_mode=None, stage_times=None, max_dim=None, roi_margin=None,
+                  attempt_id=None):
+    """Extract and score a video; stage_times, if given, collects seconds per stage (see score_pose_tracks).
+
+    With an attempt_id the extracted tracks are saved under it (see save_tracks).
+    """
+    tracks = extract_video_tracks(video_path, mirror_mode, stage_times, max_dim, roi_margin)
+    if tracks is not None:
+        save_tracks(attempt_id, tracks)
+    if tracks is None:
+        return 0.0, {
+            "worst_landmarks": [],
+            "frame_feedback": [],
+            "angle_errors": {},
+            "body_part_feedback": [],
+            "video_error": True,
+            "message": "Could not process the video file. Please try recording again."
+        }
+    return score_pose_tracks(*tracks, reference, stage_times)
+
+def ensure_reference_pack():
+    """Build DANCE_POSES_PACK, or rebuild it if a figure changed, so processes started now can map it."""
+    try:
+        ensure_pack(DANCE_POSES_PACK, DANCE_POSES_DIR, LANDMARK_IDS)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not build {DANCE_POSES_PACK}, new processes will parse the JSON figures: {e}")
+
+def live_session(reference):
+    """A LiveSession scoring streamed frames against reference, video frames going through the live pose pool."""
+    return LiveSession(reference, live_pose_pool, MIRROR_MODE, InferenceInput(MAX_INFERENCE_DIM, ROI_MARGIN),
+                       pose_wait=LIVE_POSE_WAIT)
+
+def recognize_tracks(user_poses, user_times, user_poses_flipped, user_times_flipped, top_k=3):
+    """Best matching reference figures for extracted tracks; returns (matches, search stats)."""
+    if len(user_poses) < MIN_VALID_POSES and len(user_poses_flipped) < MIN_VALID_POSES:
+        return [], {}
+    queries = {'normal': normalize_poses(as_pose_array(user_poses)),
+               'flipped': normalize_poses(as_pose_array(user_poses_flipped))}
+    with span('recognize'):
+        return figure_index.search(queries, top_k)
+
+def score_pose_tracks(user_poses, user_times, user_poses_flipped, user_times_flipped, reference, stage_times=None,
+                      alignments=None):
+    """Gate, align and score extracted tracks (normal and mirrored) against a reference figure.
+
+    stage_times, if given, gets the seconds spent in 'normalization', 'dtw' and 'feedback'.
+    alignments, if given, are the tracks' unbanded (cost, path) against the
+    reference already computed (e.g. by OnlineDTW while streaming); they're
+    used instead of aligning again unless DTW_BAND is set.
+    """
+    # Strict check: require at least MIN_VALID_POSES valid frames in either normal or flipped
+    if len(user_poses) < MIN_VALID_POSES and len(user_poses_flipped) < MIN_VALID_POSES:
+        print("❌ No valid body detected in video.")
+        inc('flipino_rejections_total', reason='no_body')
+        return 0.0, {
+            "worst_landmarks": [],
+            "frame_feedback": [],
+            "angle_errors": {},
+            "body_part_feedback": [],
+            "no_body_detected": True,
+            "message": "No body detected in the video. Please ensure you're visible in the frame and try again."
+        }
+
+    # Normalize and measure each track once; everything below works on whole arrays
+    with span('normalization', stage_times):
+        user_poses, user_poses_flipped = as_pose_array(user_poses), as_pose_array(user_poses_flipped)
+        user_normalized, user_normalized_flipped = normalize_poses(user_poses), normalize_poses(user_poses_flipped)
+
+        # --- MOVEMENT THRESHOLD CHECK ---
+        min_movement = 1.0  # <-- This is the threshold
+
+        user_movement = movement_amount(user_normalized)
+        user_movement_flipped = movement_amount(user_normalized_flipped)
+
+    if user_movement < min_movement and user_movement_flipped < min_movement:
+        print("❌ Not enough movement detected.")
+        inc('flipino_rejections_total', reason='no_movement')
+        return 0.0, {
+            "worst_landmarks": [],
+            "frame_feedback": [],
+            "angle_errors": {},
+            "body_part_feedback": [],
+            "no_movement_detected": True,
+            "message": "Not enough movement detected. Please perform the dance with more movement."
+        }
+
+    # DTW for best alignment, both orientations in one batched call; an empty track scores 0
+    with span('dtw', stage_times):
+        if alignments is not None and DTW_BAND is None:
+            (cost_normal, path_normal), (cost_flipped, path_flipped) = alignments
+        else:
+            width = len(LANDMARK_IDS) * 3
+            (cost_normal, path_normal), (cost_flipped, path_flipped) = dtw_batch(
+                [user_normalized.reshape(len(user_normalized), width),
+                 user_normalized_flipped.reshape(len(user_normalized_flipped), width)],
+                reference.normalized.reshape(len(reference), width), band=DTW_BAND)
+        score_normal = dtw_similarity(cost_normal, path_normal)
+        score_flipped = dtw_similarity(cost_flipped, path_flipped)
+
+    path = path_normal
+    if score_flipped > score_normal or not path_normal:
+        print("🔄 Using flipped video for best score.")
+        user_poses, user_normalized, path = user_poses_flipped, user_normalized_flipped, path_flipped
+        user_times = user_times_flipped
+
+    # Feedback compares the frames the DTW path actually matched
+    with span('feedback', stage_times):
+        user_idxs = [i for i, _ in path]
+        ref_idxs = [j for _, j in path]
+        return compare_dance(user_normalized[user_idxs], reference.normalized[ref_idxs].astype(np.float64),
+                             joint_angles(user_poses[user_idxs]), reference.angles[ref_idxs].astype(np.float64),
+                             np.asarray(user_times)[user_idxs])
+
+def compare_poses(pose1, pose2, return_errors=False):
+    if not pose1 or not pose2:
+        return (0.0, {}) if return_errors else 0.0
+
+    pose1 = normalize_poses([pose1])[0]
+    pose2 = normalize_poses([pose2])[0]
+
+    min_length = min(len(pose1), len(pose2))
+    pose1, pose2 = pose1[:min_length], pose2[:min_length]
+
+    differences = np.linalg.norm(pose1 - pose2, axis=1)
+    avg_difference = np.mean(differences)
+    threshold = 0.9  # More lenient
+    similarity_score = max(0, 1 - (avg_difference / threshold))
+
+    # Per-landmark error (by index in LANDMARK_IDS order)
+    errors = {list(LANDMARK_IDS)[idx]: float(diff) for idx, diff in enumerate(differences)}
+
+    if return_errors:
+        return similarity_score, errors
+    else:
+        return similarity_score
+
+
+def warm_up():
+    """Create and warm every pose estimator now instead of on the first uploads."""
+    try:
+        pose_pool.warm_up()
+    except Exception as e:
+        print(f"❌ Pose pool warm-up failed: {e}")
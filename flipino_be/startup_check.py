@@ -0,0 +1,77 @@
+"""Measure how fast app.py starts for the light endpoints and fail if the scoring stack leaks in.
+
+Each run uses a fresh interpreter (nothing cached in sys.modules) and reports
+the import time of app.py, the time to answer a first light request, and any
+heavy modules that got imported. Exits 1 on a heavy import or a blown budget,
+so it can gate CI or a deploy:
+
+    python startup_check.py [--role api] [--budget 3.0] [--json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ['cv2', 'mediapipe', 'numpy', 'scipy', 'fastdtw', 'supabase', 'scoring_service']
+
+PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/jobs/not-a-job')
+answered = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - start,
+    "first_request_seconds": answered - imported,
+    "first_request_status": response.status_code,
+    "heavy_modules": [m for m in HEAVY if m in sys.modules],
+}))
+'''
+
+
+def measure(role):
+    env = dict(os.environ, SERVICE_ROLE=role, POSE_POOL_WARMUP='0', DB_POOL_WARMUP='0')
+    env.setdefault('SUPABASE_URL', 'http://localhost')
+    env.setdefault('SUPABASE_KEY', 'startup-check')
+    code = f"HEAVY = {HEAVY_MODULES!r}\n" + PROBE
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"app.py failed to start:\n{result.stderr}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["role"] = role
+    report["cold_start_seconds"] = report["import_seconds"] + report["first_request_seconds"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check app.py cold start for the light endpoints.")
+    parser.add_argument('--role', default='api', choices=['api', 'all'], help="SERVICE_ROLE to start")
+    parser.add_argument('--budget', type=float, default=3.0, help="max cold start seconds")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = measure(args.role)
+    failures = []
+    if report["heavy_modules"]:
+        failures.append(f"heavy modules imported at startup: {', '.join(report['heavy_modules'])}")
+    if report["cold_start_seconds"] > args.budget:
+        failures.append(f"cold start {report['cold_start_seconds']:.2f}s is over the {args.budget:.2f}s budget")
+    report["failures"] = failures
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"⏱️ SERVICE_ROLE={args.role}: import {report['import_seconds']:.3f}s, "
+              f"first request {report['first_request_seconds']:.3f}s (HTTP {report['first_request_status']})")
+        for failure in failures:
+            print(f"❌ {failure}")
+        if not failures:
+            print("✅ No scoring stack loaded at startup")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import types
+
+import cv2
+import numpy as np
+
+import scoring_service
+from extractor import Landmark
+from pose_pool import PosePool
+
+
+class BrightFramePose:
+    """Finds a moving body in bright frames and nothing in dark ones."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def process(self, frame_rgb):
+        self.calls += 1
+        if frame_rgb.mean() < 128:
+            return types.SimpleNamespace(pose_landmarks=None)
+        landmarks = [Landmark(0.3 + 0.4 * (i % 2) + 0.2 * np.sin(2 * self.calls + i), 0.1 + 0.025 * i, 0.0, 0.9)
+                     for i in range(33)]
+        return types.SimpleNamespace(pose_landmarks=types.SimpleNamespace(landmark=landmarks))
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def write_video(path, seconds_dark, seconds_bright, fps=30):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, (64, 64))
+    for i in range(int((seconds_dark + seconds_bright) * fps)):
+        writer.write(np.full((64, 64, 3), 0 if i < seconds_dark * fps else 255, dtype=np.uint8))
+    writer.release()
+
+
+def test_a_dancer_who_walks_in_late_is_still_scored(tmp_path, monkeypatch):
+    video = tmp_path / 'late.avi'
+    write_video(video, seconds_dark=8, seconds_bright=4)  # 48 empty samples at 6/s, past the old budget of 30
+    monkeypatch.setattr(scoring_service, 'pose_pool', PosePool(1, factory=lambda complexity: BrightFramePose()))
+    reference = scoring_service.reference_store.get('TiklosBoyFig1.json')
+
+    accuracy, feedback = scoring_service.process_video(str(video), reference)
+
+    assert not feedback.get('no_body_detected')
+    assert not feedback.get('video_error')
+    assert accuracy > 0
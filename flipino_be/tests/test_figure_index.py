@@ -0,0 +1,22 @@
+import numpy as np
+
+from figure_index import FigureIndex
+from scoring import LANDMARK_IDS
+from reference_store import ReferenceStore
+from scoring_service import DANCE_POSES_DIR
+
+
+def test_matches_are_ranked_by_score_even_when_far_from_every_figure():
+    store = ReferenceStore(DANCE_POSES_DIR, LANDMARK_IDS).load_all()
+    index = FigureIndex(store, band=12)
+    figure = store.get('TiklosBoyFig1.json')
+    # Noisy enough that the mean matched-frame distance is well over 1, where dtw_similarity is 0 for every figure
+    rng = np.random.default_rng(0)
+    query = figure.normalized + rng.normal(0, 0.5, figure.normalized.shape)
+
+    matches, _ = index.search({'normal': query}, top_k=3)
+
+    assert matches[0]['figure'] == figure.name
+    scores = [match['score'] for match in matches]
+    assert scores == sorted(scores, reverse=True)
+    assert scores[0] > scores[1] > 0
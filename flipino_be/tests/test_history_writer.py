@@ -0,0 +1,77 @@
+import contextlib
+import time
+import uuid
+
+import history_writer
+from history_writer import HistoryWriter
+
+
+class FakeConnection:
+    def cursor(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def writer_with_calls(monkeypatch, connection=None, **kwargs):
+    calls = []
+    monkeypatch.setattr(history_writer, 'write_history',
+                        lambda cursor, rows, counts: calls.append((list(rows), dict(counts))))
+    connection = connection or contextlib.contextmanager(lambda: (yield FakeConnection()))
+    return HistoryWriter(connection, **kwargs), calls
+
+
+def test_records_within_an_interval_are_written_in_one_flush(monkeypatch):
+    writer, calls = writer_with_calls(monkeypatch, interval=1.0)
+    try:
+        for _ in range(10):
+            writer.record(str(uuid.uuid4()), 'Tiklos', 'TiklosBoyFig1.json', 80.0)
+            time.sleep(0.02)
+        time.sleep(1.5)
+        assert len(calls) == 1
+        rows, counts = calls[0]
+        assert len(rows) == 10
+        assert counts == {'Tiklos': 10}
+    finally:
+        writer.close()
+
+
+def test_a_full_buffer_flushes_before_the_interval(monkeypatch):
+    writer, calls = writer_with_calls(monkeypatch, interval=60.0, max_rows=5)
+    try:
+        for _ in range(5):
+            writer.record(str(uuid.uuid4()), 'Tiklos', 'TiklosBoyFig1.json', 80.0)
+        assert writer.flush(timeout=5)
+        assert len(calls) == 1
+    finally:
+        writer.close()
+
+
+def test_a_failed_flush_is_retried_once_per_interval(monkeypatch):
+    attempts = []
+
+    @contextlib.contextmanager
+    def down():
+        attempts.append(time.monotonic())
+        raise OSError("database is down")
+        yield
+
+    writer, calls = writer_with_calls(monkeypatch, connection=down, interval=0.5)
+    try:
+        for _ in range(20):
+            writer.record(str(uuid.uuid4()), 'Tiklos', 'TiklosBoyFig1.json', 80.0)
+            time.sleep(0.05)
+        writer.flush(timeout=0.2)  # asking to hurry doesn't skip the wait after a failure
+        assert 1 <= len(attempts) <= 4
+        assert not calls
+        assert writer.stats()['pending'] == 20
+    finally:
+        writer.connection = contextlib.contextmanager(lambda: (yield FakeConnection()))
+        writer.close()
@@ -0,0 +1,48 @@
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+import scoring_service
+from live_scoring import FRAME_HEADER
+from pose_pool import PosePool
+
+
+class NoBodyPose:
+    def process(self, frame_rgb):
+        return types.SimpleNamespace(pose_landmarks=None)
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def frame_message(timestamp):
+    return FRAME_HEADER.pack(timestamp) + cv2.imencode('.jpg', np.zeros((32, 32, 3), dtype=np.uint8))[1].tobytes()
+
+
+def test_live_streams_never_hold_an_upload_estimator(monkeypatch):
+    uploads = PosePool(1, factory=lambda complexity: NoBodyPose())
+    streams = PosePool(1, factory=lambda complexity: NoBodyPose())
+    monkeypatch.setattr(scoring_service, 'pose_pool', uploads)
+    monkeypatch.setattr(scoring_service, 'live_pose_pool', streams)
+    monkeypatch.setattr(scoring_service, 'LIVE_POSE_WAIT', 0.1)
+    reference = scoring_service.reference_store.get('TiklosBoyFig1.json')
+
+    first = scoring_service.live_session(reference)
+    second = scoring_service.live_session(reference)
+    try:
+        for i in range(3):
+            first.add_video_frame(frame_message(i / 6))
+        with uploads.acquire(timeout=0.1):
+            pass  # an upload still gets its estimator while the stream runs
+        with pytest.raises(ValueError):
+            second.add_video_frame(frame_message(0.0))  # the only live estimator is taken
+        assert streams.stats()['created'] == 1
+    finally:
+        first.close()
+        second.close()
+    assert streams.stats()['in_use'] == 0
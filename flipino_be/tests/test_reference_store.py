@@ -0,0 +1,30 @@
+import os
+import shutil
+
+from reference_store import PackedReferenceStore, ensure_pack
+from scoring import LANDMARK_IDS
+from scoring_service import DANCE_POSES_DIR
+
+
+def copy_figures(directory, names):
+    directory.mkdir()
+    for name in names:
+        shutil.copy(os.path.join(DANCE_POSES_DIR, name), directory / name)
+
+
+def test_pack_is_built_when_missing_and_rebuilt_when_a_figure_changes(tmp_path):
+    figures = tmp_path / 'dance_poses'
+    copy_figures(figures, ['TiklosBoyFig1.json', 'TiklosBoyFig2.json'])
+    pack = str(tmp_path / 'dance_poses.pack')
+
+    assert ensure_pack(pack, str(figures), LANDMARK_IDS)
+    assert not ensure_pack(pack, str(figures), LANDMARK_IDS)
+    assert PackedReferenceStore(pack).load_all().names() == ['TiklosBoyFig1', 'TiklosBoyFig2']
+
+    shutil.copy(os.path.join(DANCE_POSES_DIR, 'TiklosBoyFig3.json'), figures / 'TiklosBoyFig2.json')
+    os.utime(figures / 'TiklosBoyFig2.json', (1, 1))  # a new mtime even on coarse clocks
+    assert ensure_pack(pack, str(figures), LANDMARK_IDS)
+    assert not ensure_pack(pack, str(figures), LANDMARK_IDS)
+
+    shutil.copy(os.path.join(DANCE_POSES_DIR, 'TiklosBoyFig3.json'), figures / 'TiklosBoyFig3.json')
+    assert ensure_pack(pack, str(figures), LANDMARK_IDS)
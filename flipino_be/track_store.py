@@ -0,0 +1,62 @@
+"""Pose tracks of scored attempts, kept so attempts can be re-scored without their videos.
+
+Each attempt's normal and mirrored tracks are saved as <root>/<id[:2]>/<id>.npz,
+keyed by its user_history id: float32 poses and float64 times, about 6 KB per
+track for a 30 second recording. Files are written atomically, so a reader
+never sees half a track, and never changed in place, so attempts of the same
+video can share one file through hard links.
+"""
+import os
+import tempfile
+import uuid
+
+import numpy as np
+
+from scoring import LANDMARK_IDS
+
+
+class TrackStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, attempt_id):
+        attempt_id = str(uuid.UUID(str(attempt_id)))  # raises ValueError, and keeps ids out of other folders
+        return os.path.join(self.root, attempt_id[:2], attempt_id + '.npz')
+
+    def save(self, attempt_id, user_poses, user_times, user_poses_flipped, user_times_flipped):
+        path = self.path(attempt_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f,
+                         poses=np.asarray(user_poses, dtype=np.float32).reshape(-1, len(LANDMARK_IDS), 3),
+                         times=np.asarray(user_times, dtype=np.float64),
+                         poses_flipped=np.asarray(user_poses_flipped, dtype=np.float32).reshape(-1, len(LANDMARK_IDS), 3),
+                         times_flipped=np.asarray(user_times_flipped, dtype=np.float64))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def link(self, source_id, attempt_id):
+        """Keep source_id's tracks for attempt_id too (a hard link); False if source_id has none."""
+        source, path = self.path(source_id), self.path(attempt_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(source, path)
+        except FileNotFoundError:
+            return False
+        except FileExistsError:
+            pass
+        return True
+
+    def load(self, attempt_id):
+        """(user_poses, user_times, user_poses_flipped, user_times_flipped), or None if none were saved."""
+        try:
+            with np.load(self.path(attempt_id)) as data:
+                return data['poses'], data['times'], data['poses_flipped'], data['times_flipped']
+        except (OSError, ValueError, KeyError):
+            return None
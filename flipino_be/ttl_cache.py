@@ -0,0 +1,46 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserTTLCache:
+    """Short-lived response cache grouped by user so one user's entries can be dropped together.
+
+    Entries expire after `ttl` seconds; at most max_users users are kept,
+    least recently used first out. It's per process, so other workers only
+    see a write once their entries expire.
+    """
+
+    def __init__(self, ttl=10.0, max_users=1000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, key):
+        now = time.monotonic()
+        with self._lock:
+            entries = self._users.get(user_id)
+            entry = entries.get(key) if entries else None
+            if entry is None or entry[0] <= now:
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            entries = self._users.setdefault(user_id, {})
+            entries[key] = (time.monotonic() + self.ttl, value)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
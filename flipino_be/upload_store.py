@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadStore:
+    """Content-addressed upload storage with a scoring result cache.
+
+    Videos are saved as <root>/<sha256><ext>, so identical uploads share one
+    file and concurrent uploads can't overwrite each other. Results are kept
+    as JSON under <root>/results, keyed by (video hash, figure, version), the
+    version covering everything else the score depends on. Both count
+    against one disk budget, least recently used first.
+    """
+
+    def __init__(self, root, budget_bytes):
+        self.root = root
+        self.results_dir = os.path.join(root, 'results')
+        self.budget_bytes = budget_bytes
+        self._evict_lock = threading.Lock()
+        os.makedirs(self.results_dir, exist_ok=True)
+
+    def save(self, file_storage):
+        """Stream an uploaded file to disk while hashing it; returns (digest, path)."""
+        ext = os.path.splitext(file_storage.filename or '')[1].lower() or '.mp4'
+        if not ext[1:].isalnum():
+            ext = '.mp4'
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = file_storage.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+            digest = digest.hexdigest()
+            path = os.path.join(self.root, digest + ext)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                self._touch(path)
+            else:
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict(keep=path)
+        return digest, path
+
+    def find(self, digest):
+        """Path of a stored video by hash, or None if it was never stored or got evicted."""
+        if not digest or not all(c in '0123456789abcdef' for c in digest):
+            return None
+        for filename in os.listdir(self.root):
+            if filename.startswith(digest + '.') and not filename.endswith('.part'):
+                path = os.path.join(self.root, filename)
+                self._touch(path)
+                return path
+        return None
+
+    def _result_path(self, digest, figure, version):
+        key = hashlib.sha256(f"{digest}|{figure}|{version}".encode('utf-8')).hexdigest()
+        return os.path.join(self.results_dir, key + '.json')
+
+    def get_result(self, digest, figure, version):
+        path = self._result_path(digest, figure, version)
+        try:
+            with open(path, 'r') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._touch(path)
+        return result
+
+    def put_result(self, digest, figure, version, result):
+        path = self._result_path(digest, figure, version)
+        fd, tmp_path = tempfile.mkstemp(dir=self.results_dir, suffix='.part')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for folder in (self.root, self.results_dir):
+            for entry in os.scandir(folder):
+                if entry.is_file() and not entry.name.endswith('.part'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def usage(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep=None):
+        """Delete least recently used videos and results until usage fits the budget."""
+        if not self.budget_bytes:
+            return 0
+        with self._evict_lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.budget_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            if removed:
+                print(f"🧹 Evicted {removed} stored uploads/results, {total} bytes in use")
+            return removed
@@ -0,0 +1,67 @@
+"""Scoring worker: drains the scoring_jobs queue that /upload fills in async mode.
+
+Start as many of these as you like, on one node or many:
+    python worker.py [--poll 1.0]
+"""
+import argparse
+import os
+import socket
+import tempfile
+import time
+import traceback
+
+from app import db_connection, score_video
+from jobs import claim_job, complete_job, fail_job, requeue_stale_jobs
+
+JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', '600'))  # seconds before a running job counts as abandoned
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+
+def run_job(job):
+    fd, video_path = tempfile.mkstemp(suffix='.mp4')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(job["video"])
+        return score_video(video_path, job["figure_name"], job["user_id"])
+    finally:
+        os.remove(video_path)
+
+
+def run_worker(worker_id, poll_interval):
+    print(f"👷 Scoring worker {worker_id} started")
+    last_sweep = 0.0
+    while True:
+        try:
+            # Hold a pooled connection only while talking to the queue, not while scoring
+            with db_connection() as conn:
+                if time.monotonic() - last_sweep > JOB_TIMEOUT / 2:
+                    requeued = requeue_stale_jobs(conn, JOB_TIMEOUT, JOB_MAX_ATTEMPTS)
+                    if requeued:
+                        print(f"🔁 Requeued {requeued} abandoned jobs")
+                    last_sweep = time.monotonic()
+                job = claim_job(conn, worker_id)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+
+            print(f"🎬 Job {job['id']}: scoring {job['figure_name']} (attempt {job['attempts']})")
+            try:
+                body, status = run_job(job)
+            except Exception as e:
+                traceback.print_exc()
+                with db_connection() as conn:
+                    fail_job(conn, job["id"], str(e), JOB_MAX_ATTEMPTS)
+                continue
+            with db_connection() as conn:
+                complete_job(conn, job["id"], body, status)
+            print(f"✅ Job {job['id']} done: {body.get('accuracy')}")
+        except Exception as e:
+            print(f"❌ Worker error: {e}")
+            time.sleep(poll_interval)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a scoring worker.")
+    parser.add_argument('--poll', type=float, default=1.0, help="seconds to sleep when the queue is empty")
+    parser.add_argument('--id', default=f"{socket.gethostname()}:{os.getpid()}", help="worker name stored on claimed jobs")
+    args = parser.parse_args()
+    run_worker(args.id, args.poll)